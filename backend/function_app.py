@@ -1,13 +1,60 @@
 import azure.functions as func
+from azurefunctions.extensions.http.fastapi import Request, Response, StreamingResponse
 import logging
-import json
+import orjson
 import os
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
 
 app = func.FunctionApp()
 
 # Embedding settings
 EMBEDDING_MODEL = "text-embedding-3-small"
-EMBEDDING_DIMENSIONS = 1536
+# text-embedding-3 vectors can be shortened (e.g. 512) to cut index size and scan cost;
+# must match the dimension the index was built with
+EMBEDDING_DIMENSIONS = int(os.environ.get("EMBEDDING_DIMENSIONS", 1536))
+
+# Pinecone settings
+INDEX_NAME = "og-rag"
+
+# Claude settings
+CLAUDE_MODEL = "claude-sonnet-4-20250514"
+MAX_TOKENS = 1024
+STREAM_IDLE_TIMEOUT = 30.0  # Seconds without a streamed token before giving up
+
+# Answer cache (Azure Cache for Redis, enabled when REDIS_URL is set)
+ANSWER_CACHE_TTL = 3600  # Seconds; keep short so reindexed content shows up
+
+# Extract mode: return the top chunk verbatim instead of calling Claude.
+# Automatic short-circuit is opt-in via EXTRACT_SHORT_CIRCUIT=1; clients can
+# always ask for it with "snippet_only": true.
+EXTRACT_SHORT_CIRCUIT = os.environ.get("EXTRACT_SHORT_CIRCUIT", "").lower() in ("1", "true")
+EXTRACT_MIN_SCORE = 0.92
+
+NO_CONTEXT_ANSWER = "I couldn't find any relevant information in the knowledge base for this query. Try rephrasing your question or lowering the similarity threshold."
+
+SYSTEM_PROMPT = """You are an Oil & Gas domain expert assistant with deep knowledge of:
+- Offshore and onshore safety regulations (BSEE, PHMSA, OSHA)
+- Equipment operations (BOPs, ESPs, compressors, pipelines, separators)
+- Incident investigation and root cause analysis
+- HSE compliance and best practices
+
+You have access to a knowledge base of regulatory documents, safety alerts, investigation reports, and technical guidance.
+
+When answering questions:
+1. Base your answers on the provided context from the knowledge base
+2. Cite specific sources when possible (e.g., "According to BSEE Safety Alert...")
+3. If the context doesn't contain enough information, say so clearly
+4. Provide actionable, practical guidance when appropriate
+5. Use industry-standard terminology
+
+If asked about something outside the O&G domain or not covered in the context, acknowledge the limitation."""
+
+# System prompt as a cacheable block so Claude can reuse the prefix across requests
+SYSTEM_BLOCKS = [{"type": "text", "text": SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}}]
 
 # =============================================================================
 # CORS Headers Helper
@@ -22,14 +69,17 @@ CORS_HEADERS = {
 # =============================================================================
 # Health Check
 # =============================================================================
-@app.function_name(name="health_check")
-@app.route(route="health", methods=["GET"], auth_level=func.AuthLevel.ANONYMOUS)
-def health_check(req: func.HttpRequest) -> func.HttpResponse:
-    """Diagnostic endpoint to check imports and API keys."""
+# Import probes only need to run once per worker; frequent health probes
+# then cost a dict copy instead of a trip through the import machinery.
+_IMPORT_STATUS = None
+
+
+def check_imports() -> dict:
+    """Try importing each SDK the API depends on and report the outcome."""
     results = {}
     
     try:
-        from pinecone import Pinecone
+        from pinecone.grpc import PineconeGRPC  # noqa: F401
         results["pinecone"] = "OK"
     except Exception as e:
         results["pinecone"] = f"FAIL - {e}"
@@ -46,25 +96,186 @@ def health_check(req: func.HttpRequest) -> func.HttpResponse:
     except Exception as e:
         results["anthropic"] = f"FAIL - {e}"
     
+    return results
+
+
+@app.function_name(name="health_check")
+@app.route(route="health", methods=["GET"], auth_level=func.AuthLevel.ANONYMOUS)
+def health_check(req: func.HttpRequest) -> func.HttpResponse:
+    """Diagnostic endpoint to check imports and API keys."""
+    global _IMPORT_STATUS
+    if _IMPORT_STATUS is None:
+        _IMPORT_STATUS = check_imports()
+    
+    results = dict(_IMPORT_STATUS)
+    
     # Check API keys are configured (don't expose values)
     results["PINECONE_API_KEY"] = "SET" if os.environ.get("PINECONE_API_KEY") else "MISSING"
     results["OPENAI_API_KEY"] = "SET" if os.environ.get("OPENAI_API_KEY") else "MISSING"
     results["ANTHROPIC_API_KEY"] = "SET" if os.environ.get("ANTHROPIC_API_KEY") else "MISSING"
     
     return func.HttpResponse(
-        json.dumps(results, indent=2),
+        orjson.dumps(results, option=orjson.OPT_INDENT_2),
         mimetype="application/json",
         headers=CORS_HEADERS
     )
 
 
-def get_embedding(text: str, openai_client) -> list[float]:
-    """Get embedding from OpenAI API."""
+# =============================================================================
+# Client Cache
+# =============================================================================
+# Clients are built on first use and reused across warm invocations, so the
+# hot path is one embedding call, one Pinecone query and one Claude call.
+_INDEX = None
+_OPENAI = None
+_ANTHROPIC = None
+_REDIS = None
+_HTTP = None
+
+# One lock per client (checked again under the lock), so concurrent cold
+# requests and the background pool never build a client twice, while building
+# one client doesn't hold up the others
+_INDEX_LOCK = threading.Lock()
+_OPENAI_LOCK = threading.Lock()
+_ANTHROPIC_LOCK = threading.Lock()
+_REDIS_LOCK = threading.Lock()
+_HTTP_LOCK = threading.Lock()
+
+# Background pool for work that can overlap the retrieval round-trips
+_EXECUTOR = ThreadPoolExecutor(max_workers=4)
+
+
+def _get_http_client():
+    """Return the keep-alive HTTP/2 client shared by the OpenAI and Anthropic SDKs."""
+    global _HTTP
+    if _HTTP is None:
+        with _HTTP_LOCK:
+            if _HTTP is None:
+                import httpx
+                _HTTP = httpx.Client(
+                    http2=True,
+                    timeout=60.0,
+                    limits=httpx.Limits(max_keepalive_connections=20)
+                )
+    return _HTTP
+
+
+def _get_index():
+    """Return the shared Pinecone index handle."""
+    global _INDEX
+    if _INDEX is None:
+        with _INDEX_LOCK:
+            if _INDEX is None:
+                from pinecone.grpc import PineconeGRPC as Pinecone
+                pc = Pinecone(api_key=os.environ.get("PINECONE_API_KEY"), pool_threads=30)
+                _INDEX = pc.Index(INDEX_NAME)
+    return _INDEX
+
+
+def _get_openai():
+    """Return the shared OpenAI client."""
+    global _OPENAI
+    if _OPENAI is None:
+        with _OPENAI_LOCK:
+            if _OPENAI is None:
+                from openai import OpenAI
+                _OPENAI = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"), http_client=_get_http_client())
+    return _OPENAI
+
+
+def _get_anthropic():
+    """Return the shared Anthropic client."""
+    global _ANTHROPIC
+    if _ANTHROPIC is None:
+        with _ANTHROPIC_LOCK:
+            if _ANTHROPIC is None:
+                import anthropic
+                _ANTHROPIC = anthropic.Anthropic(
+                    api_key=os.environ.get("ANTHROPIC_API_KEY"),
+                    http_client=_get_http_client()
+                )
+    return _ANTHROPIC
+
+
+def _anthropic_future() -> Future:
+    """The Anthropic client as a future: already resolved when warm, else built on _EXECUTOR."""
+    if _ANTHROPIC is not None:
+        future = Future()
+        future.set_result(_ANTHROPIC)
+        return future
+    return _EXECUTOR.submit(_get_anthropic)
+
+
+def _get_redis():
+    """Return the shared Redis client, or None when no cache is configured."""
+    global _REDIS
+    if _REDIS is None and os.environ.get("REDIS_URL"):
+        with _REDIS_LOCK:
+            if _REDIS is None:
+                import redis
+                _REDIS = redis.Redis.from_url(os.environ["REDIS_URL"])
+    return _REDIS
+
+
+# Prewarmed instances can build clients at import time so the first HTTP hit is warm
+if os.environ.get("PRELOAD_CLIENTS"):
+    try:
+        _get_index()
+        _get_openai()
+        _get_anthropic()
+    except Exception as e:
+        logging.warning(f"Client preload failed: {e}")
+
+
+def get_embedding(texts: list[str], openai_client) -> list[list[float]]:
+    """Get embeddings for one or more texts from OpenAI API (up to 2048 per call)."""
     response = openai_client.embeddings.create(
         model=EMBEDDING_MODEL,
-        input=text
+        input=texts,
+        dimensions=EMBEDDING_DIMENSIONS
     )
-    return response.data[0].embedding
+    return [item.embedding for item in response.data]
+
+
+def embedding_text(query: str) -> str:
+    """Collapse whitespace only; case is what tells BOP or H2S apart from ordinary words."""
+    return " ".join(query.split())
+
+
+@lru_cache(maxsize=4096)
+def _embed_cached(query_text: str) -> list[float]:
+    """Embed a query (as given by embedding_text), memoized per worker."""
+    return get_embedding([query_text], _get_openai())[0]
+
+
+def answer_cache_key(query: str, top_k: int, min_score: float, source: str = None) -> str:
+    """Cache key for a full RAG answer."""
+    raw = f"{embedding_text(query)}|{top_k}|{min_score}|{source or ''}"
+    return "ans:" + hashlib.sha256(raw.encode()).hexdigest()
+
+
+def get_cached_answer(key: str) -> dict | None:
+    """Look up a cached {answer, sources} payload; cache errors are treated as misses."""
+    r = _get_redis()
+    if r is None:
+        return None
+    try:
+        cached = r.get(key)
+        return orjson.loads(cached) if cached else None
+    except Exception as e:
+        logging.warning(f"Answer cache read failed: {e}")
+        return None
+
+
+def set_cached_answer(key: str, payload: dict):
+    """Store an {answer, sources} payload in the answer cache."""
+    r = _get_redis()
+    if r is None:
+        return
+    try:
+        r.setex(key, ANSWER_CACHE_TTL, orjson.dumps(payload))
+    except Exception as e:
+        logging.warning(f"Answer cache write failed: {e}")
 
 
 # =============================================================================
@@ -80,13 +291,16 @@ def rag_query(req: func.HttpRequest) -> func.HttpResponse:
     {
         "query": "What causes high motor temperature in ESP systems?",
         "top_k": 10,
-        "min_score": 0.7
+        "min_score": 0.7,
+        "source": "bsee",  // optional: bsee, phmsa, osha, csb, ...
+        "snippet_only": false  // optional: return the top chunk, skip Claude
     }
     
     Response:
     {
         "answer": "...",
-        "sources": [...]
+        "sources": [...],
+        "mode": "generated" | "extract"
     }
     """
     # Handle CORS preflight
@@ -95,10 +309,10 @@ def rag_query(req: func.HttpRequest) -> func.HttpResponse:
     
     # Parse request
     try:
-        body = req.get_json()
+        body = orjson.loads(req.get_body())
     except ValueError:
         return func.HttpResponse(
-            json.dumps({"error": "Invalid JSON payload"}),
+            orjson.dumps({"error": "Invalid JSON payload"}),
             status_code=400,
             mimetype="application/json",
             headers=CORS_HEADERS
@@ -107,7 +321,7 @@ def rag_query(req: func.HttpRequest) -> func.HttpResponse:
     query = body.get("query", "").strip()
     if not query:
         return func.HttpResponse(
-            json.dumps({"error": "Query is required"}),
+            orjson.dumps({"error": "Query is required"}),
             status_code=400,
             mimetype="application/json",
             headers=CORS_HEADERS
@@ -115,111 +329,80 @@ def rag_query(req: func.HttpRequest) -> func.HttpResponse:
     
     top_k = int(body.get("top_k", 10))
     min_score = float(body.get("min_score", 0.7))
+    source = (body.get("source") or "").strip().lower() or None
+    snippet_only = bool(body.get("snippet_only", False))
     
-    logging.info(f"RAG query: '{query[:50]}...' top_k={top_k} min_score={min_score}")
+    logging.info(f"RAG query: '{query[:50]}...' top_k={top_k} min_score={min_score} source={source}")
     
     try:
-        from pinecone import Pinecone
-        from openai import OpenAI
-        import anthropic
-        
         pinecone_key = os.environ.get("PINECONE_API_KEY")
         openai_key = os.environ.get("OPENAI_API_KEY")
         anthropic_key = os.environ.get("ANTHROPIC_API_KEY")
         
         if not all([pinecone_key, openai_key, anthropic_key]):
             return func.HttpResponse(
-                json.dumps({"error": "API keys not configured"}),
+                orjson.dumps({"error": "API keys not configured"}),
                 status_code=500,
                 mimetype="application/json",
                 headers=CORS_HEADERS
             )
         
-        # Initialize clients
-        pc = Pinecone(api_key=pinecone_key)
-        index = pc.Index("og-rag")
-        openai_client = OpenAI(api_key=openai_key)
-        
-        # Embed query using OpenAI
-        query_embedding = get_embedding(query, openai_client)
+        cache_key = answer_cache_key(query, top_k, min_score, source)
+        cached = None if snippet_only else get_cached_answer(cache_key)
+        if cached:
+            return func.HttpResponse(
+                orjson.dumps(cached),
+                mimetype="application/json",
+                headers=CORS_HEADERS
+            )
         
-        # Search Pinecone
-        results = index.query(
-            vector=query_embedding,
-            top_k=top_k,
-            include_metadata=True
-        )
+        # Ready the Anthropic client alongside retrieval
+        anthropic_future = _anthropic_future()
         
-        # Filter by min_score and extract contexts
-        contexts = []
-        for match in results.matches:
-            if match.score >= min_score:
-                contexts.append({
-                    "text": match.metadata.get("text", ""),
-                    "source": match.metadata.get("source", "unknown").upper(),
-                    "doc_type": match.metadata.get("doc_type", "unknown"),
-                    "source_file": match.metadata.get("source_file", ""),
-                    "score": match.score
-                })
+        contexts = retrieve_contexts(query, top_k, min_score, source)
         
         if not contexts:
             return func.HttpResponse(
-                json.dumps({
-                    "answer": "I couldn't find any relevant information in the knowledge base for this query. Try rephrasing your question or lowering the similarity threshold.",
+                orjson.dumps({
+                    "answer": NO_CONTEXT_ANSWER,
                     "sources": []
                 }),
                 mimetype="application/json",
                 headers=CORS_HEADERS
             )
         
-        # Build prompt for Claude
-        context_text = format_context_for_prompt(contexts)
+        if use_extract(contexts, snippet_only):
+            return func.HttpResponse(
+                orjson.dumps({
+                    "answer": contexts[0]["text"],
+                    "sources": contexts,
+                    "mode": "extract"
+                }),
+                mimetype="application/json",
+                headers=CORS_HEADERS
+            )
         
-        system_prompt = """You are an Oil & Gas domain expert assistant with deep knowledge of:
-- Offshore and onshore safety regulations (BSEE, PHMSA, OSHA)
-- Equipment operations (BOPs, ESPs, compressors, pipelines, separators)
-- Incident investigation and root cause analysis
-- HSE compliance and best practices
-
-You have access to a knowledge base of regulatory documents, safety alerts, investigation reports, and technical guidance.
-
-When answering questions:
-1. Base your answers on the provided context from the knowledge base
-2. Cite specific sources when possible (e.g., "According to BSEE Safety Alert...")
-3. If the context doesn't contain enough information, say so clearly
-4. Provide actionable, practical guidance when appropriate
-5. Use industry-standard terminology
-
-If asked about something outside the O&G domain or not covered in the context, acknowledge the limitation."""
-
-        user_message = f"""Based on the following sources from the O&G knowledge base, please answer the question.
-
-<knowledge_base>
-{context_text}
-</knowledge_base>
-
-<question>
-{query}
-</question>
-
-Provide a clear, accurate answer based on the sources above. Reference specific sources when making claims."""
+        user_message = build_user_message(query, contexts)
 
         # Call Claude
-        client = anthropic.Anthropic(api_key=anthropic_key)
+        client = anthropic_future.result()
         response = client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=1024,
-            system=system_prompt,
+            model=CLAUDE_MODEL,
+            max_tokens=MAX_TOKENS,
+            system=SYSTEM_BLOCKS,
             messages=[{"role": "user", "content": user_message}]
         )
         
         answer = response.content[0].text
+        payload = {
+            "answer": answer,
+            "sources": contexts,
+            "mode": "generated"
+        }
+        set_cached_answer(cache_key, payload)
         
         return func.HttpResponse(
-            json.dumps({
-                "answer": answer,
-                "sources": contexts
-            }),
+            orjson.dumps(payload),
             mimetype="application/json",
             headers=CORS_HEADERS
         )
@@ -227,22 +410,190 @@ Provide a clear, accurate answer based on the sources above. Reference specific
     except Exception as e:
         logging.error(f"RAG query error: {e}")
         return func.HttpResponse(
-            json.dumps({"error": str(e)}),
+            orjson.dumps({"error": str(e)}),
             status_code=500,
             mimetype="application/json",
             headers=CORS_HEADERS
         )
 
 
+def retrieve_contexts(query: str, top_k: int, min_score: float, source: str = None) -> list[dict]:
+    """Embed the query, search Pinecone and keep matches above min_score."""
+    query_embedding = _embed_cached(embedding_text(query))
+    
+    # Filter by source server-side so unwanted matches never cross the wire
+    results = _get_index().query(
+        vector=query_embedding,
+        top_k=top_k,
+        include_metadata=True,
+        filter={"source": {"$eq": source}} if source else None
+    )
+    
+    return [
+        {
+            "text": match.metadata.get("text", ""),
+            "source": (match.metadata.get("source") or "unknown").upper(),
+            "doc_type": match.metadata.get("doc_type", "unknown"),
+            "source_file": match.metadata.get("source_file", ""),
+            "score": match.score
+        }
+        for match in results.matches
+        if match.score >= min_score
+    ]
+
+
+def build_user_message(query: str, contexts: list[dict]) -> str:
+    """Build the Claude user message from the query and retrieved contexts."""
+    context_text = format_context_for_prompt(contexts)
+    
+    return f"""Based on the following sources from the O&G knowledge base, please answer the question.
+
+<knowledge_base>
+{context_text}
+</knowledge_base>
+
+<question>
+{query}
+</question>
+
+Provide a clear, accurate answer based on the sources above. Reference specific sources when making claims."""
+
+
+def use_extract(contexts: list[dict], snippet_only: bool) -> bool:
+    """Decide whether the top chunk can be returned as-is without calling Claude."""
+    if not contexts:
+        return False
+    if snippet_only:
+        return True
+    return EXTRACT_SHORT_CIRCUIT and len(contexts) == 1 and contexts[0]["score"] >= EXTRACT_MIN_SCORE
+
+
 def format_context_for_prompt(contexts: list[dict]) -> str:
     """Format retrieved contexts for the LLM prompt."""
-    formatted = []
-    for i, ctx in enumerate(contexts, 1):
-        formatted.append(f"""<source id="{i}" origin="{ctx['source']}" type="{ctx['doc_type']}" file="{ctx['source_file']}">
-{ctx['text']}
-</source>""")
+    return "\n\n".join(
+        f'<source id="{i}" origin="{ctx["source"]}" type="{ctx["doc_type"]}" file="{ctx["source_file"]}">\n'
+        f'{ctx["text"]}\n'
+        f'</source>'
+        for i, ctx in enumerate(contexts, 1)
+    )
+
+
+# =============================================================================
+# Streaming RAG Query Endpoint
+# =============================================================================
+def sse_event(data, event: str = None) -> str:
+    """Format a Server-Sent Events frame with a JSON payload."""
+    frame = f"event: {event}\n" if event else ""
+    return f"{frame}data: {orjson.dumps(data).decode()}\n\n"
+
+
+def stream_answer(client, query: str, contexts: list[dict], cache_key: str, snippet_only: bool = False):
+    """Yield Claude's answer as SSE text frames, then a trailing sources frame."""
+    try:
+        if not contexts:
+            yield sse_event({"text": NO_CONTEXT_ANSWER})
+        elif use_extract(contexts, snippet_only):
+            yield sse_event({"text": contexts[0]["text"], "mode": "extract"})
+        else:
+            # The read timeout doubles as a stall watchdog between streamed tokens
+            with client.messages.stream(
+                model=CLAUDE_MODEL,
+                max_tokens=MAX_TOKENS,
+                system=SYSTEM_BLOCKS,
+                messages=[{"role": "user", "content": build_user_message(query, contexts)}],
+                timeout=STREAM_IDLE_TIMEOUT
+            ) as stream:
+                parts = []
+                for text in stream.text_stream:
+                    parts.append(text)
+                    yield sse_event({"text": text})
+            set_cached_answer(cache_key, {"answer": "".join(parts), "sources": contexts, "mode": "generated"})
+        
+        yield sse_event(contexts, event="sources")
+        
+    except Exception as e:
+        logging.error(f"RAG stream error: {e}")
+        yield sse_event({"error": str(e)}, event="error")
+
+
+@app.function_name(name="rag_query_stream")
+@app.route(route="query/stream", methods=["POST", "OPTIONS"], auth_level=func.AuthLevel.ANONYMOUS)
+async def rag_query_stream(req: Request) -> Response:
+    """
+    Streaming RAG query endpoint (Server-Sent Events).
     
-    return "\n\n".join(formatted)
+    Takes the same request body as /api/query. Answer text arrives as
+    `data: {"text": "..."}` frames, followed by a single `event: sources`
+    frame with the retrieved contexts. Failures after the stream has
+    started are reported as an `event: error` frame.
+    """
+    if req.method == "OPTIONS":
+        return Response("", status_code=200, headers=CORS_HEADERS)
+    
+    try:
+        body = orjson.loads(await req.body())
+    except ValueError:
+        return Response(
+            orjson.dumps({"error": "Invalid JSON payload"}),
+            status_code=400,
+            media_type="application/json",
+            headers=CORS_HEADERS
+        )
+    
+    query = body.get("query", "").strip()
+    if not query:
+        return Response(
+            orjson.dumps({"error": "Query is required"}),
+            status_code=400,
+            media_type="application/json",
+            headers=CORS_HEADERS
+        )
+    
+    top_k = int(body.get("top_k", 10))
+    min_score = float(body.get("min_score", 0.7))
+    source = (body.get("source") or "").strip().lower() or None
+    snippet_only = bool(body.get("snippet_only", False))
+    
+    logging.info(f"RAG stream query: '{query[:50]}...' top_k={top_k} min_score={min_score} source={source}")
+    
+    if not all([os.environ.get("PINECONE_API_KEY"),
+                os.environ.get("OPENAI_API_KEY"),
+                os.environ.get("ANTHROPIC_API_KEY")]):
+        return Response(
+            orjson.dumps({"error": "API keys not configured"}),
+            status_code=500,
+            media_type="application/json",
+            headers=CORS_HEADERS
+        )
+    
+    cache_key = answer_cache_key(query, top_k, min_score, source)
+    cached = None if snippet_only else await asyncio.to_thread(get_cached_answer, cache_key)
+    if cached:
+        return StreamingResponse(
+            iter([sse_event({"text": cached["answer"]}),
+                  sse_event(cached["sources"], event="sources")]),
+            media_type="text/event-stream",
+            headers={**CORS_HEADERS, "Cache-Control": "no-cache"}
+        )
+    
+    try:
+        anthropic_future = _anthropic_future()
+        contexts = await asyncio.to_thread(retrieve_contexts, query, top_k, min_score, source)
+        client = await asyncio.wrap_future(anthropic_future)
+    except Exception as e:
+        logging.error(f"RAG stream error: {e}")
+        return Response(
+            orjson.dumps({"error": str(e)}),
+            status_code=500,
+            media_type="application/json",
+            headers=CORS_HEADERS
+        )
+    
+    return StreamingResponse(
+        stream_answer(client, query, contexts, cache_key, snippet_only),
+        media_type="text/event-stream",
+        headers={**CORS_HEADERS, "Cache-Control": "no-cache"}
+    )
 
 
 # =============================================================================
@@ -253,26 +604,22 @@ def format_context_for_prompt(contexts: list[dict]) -> str:
 def corpus_stats(req: func.HttpRequest) -> func.HttpResponse:
     """Return corpus statistics from Pinecone index."""
     try:
-        from pinecone import Pinecone
-        
         pinecone_key = os.environ.get("PINECONE_API_KEY")
         if not pinecone_key:
             return func.HttpResponse(
-                json.dumps({"error": "Pinecone API key not configured"}),
+                orjson.dumps({"error": "Pinecone API key not configured"}),
                 status_code=500,
                 mimetype="application/json",
                 headers=CORS_HEADERS
             )
         
-        pc = Pinecone(api_key=pinecone_key)
-        index = pc.Index("og-rag")
-        stats = index.describe_index_stats()
+        stats = _get_index().describe_index_stats()
         
         return func.HttpResponse(
-            json.dumps({
+            orjson.dumps({
                 "total_vectors": stats.total_vector_count,
                 "dimension": stats.dimension,
-                "index_name": "og-rag",
+                "index_name": INDEX_NAME,
                 "embedding_model": EMBEDDING_MODEL
             }),
             mimetype="application/json",
@@ -282,7 +629,7 @@ def corpus_stats(req: func.HttpRequest) -> func.HttpResponse:
     except Exception as e:
         logging.error(f"Stats error: {e}")
         return func.HttpResponse(
-            json.dumps({"error": str(e)}),
+            orjson.dumps({"error": str(e)}),
             status_code=500,
             mimetype="application/json",
             headers=CORS_HEADERS
@@ -63,7 +63,7 @@ async function submitQuery() {
     hideError();
     
     try {
-        const response = await fetch(`${API_BASE}/query`, {
+        const response = await fetch(`${API_BASE}/query/stream`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -80,13 +80,7 @@ async function submitQuery() {
             throw new Error(errorData.error || `API returned ${response.status}`);
         }
         
-        const data = await response.json();
-        
-        if (data.error) {
-            throw new Error(data.error);
-        }
-        
-        displayResults(data);
+        await readAnswerStream(response);
         
     } catch (error) {
         console.error('Query error:', error);
@@ -96,21 +90,64 @@ async function submitQuery() {
     }
 }
 
-// Display results
-function displayResults(data) {
-    // Display answer
-    answerContent.innerHTML = formatAnswer(data.answer);
+// Read Server-Sent Events from the streaming endpoint.
+// Answer text arrives incrementally; sources arrive in a trailing frame.
+async function readAnswerStream(response) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let answer = '';
     
-    // Display sources
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        
+        buffer += decoder.decode(value, { stream: true });
+        const frames = buffer.split('\n\n');
+        buffer = frames.pop();
+        
+        for (const frame of frames) {
+            let event = 'message';
+            let data = '';
+            frame.split('\n').forEach(line => {
+                if (line.startsWith('event: ')) event = line.slice(7);
+                else if (line.startsWith('data: ')) data += line.slice(6);
+            });
+            if (!data) continue;
+            
+            const payload = JSON.parse(data);
+            if (event === 'error') {
+                throw new Error(payload.error);
+            } else if (event === 'sources') {
+                displaySources(payload);
+            } else {
+                if (!answer) showResults();
+                if (payload.mode === 'extract') {
+                    answer += '*Direct extract from the top source (no generated summary).*\n\n';
+                }
+                answer += payload.text;
+                answerContent.innerHTML = formatAnswer(answer);
+            }
+        }
+    }
+}
+
+// Display sources
+function displaySources(sources) {
     sourcesList.innerHTML = '';
-    sourceCount.textContent = `(${data.sources.length} retrieved)`;
+    sourceCount.textContent = `(${sources.length} retrieved)`;
     
-    data.sources.forEach((source, index) => {
+    sources.forEach((source, index) => {
         const sourceCard = createSourceCard(source, index);
         sourcesList.appendChild(sourceCard);
     });
-    
-    // Show results section
+}
+
+// Show results section (once, when the first answer text arrives)
+function showResults() {
+    answerContent.innerHTML = '';
+    sourcesList.innerHTML = '';
+    sourceCount.textContent = '';
     resultsSection.classList.remove('hidden');
     
     // Scroll to results
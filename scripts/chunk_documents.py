@@ -5,16 +5,21 @@ Creates overlapping chunks suitable for embedding and retrieval
 """
 
 from pathlib import Path
-import json
+import orjson
 import re
 import argparse
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass
 from typing import Iterator
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
 import hashlib
+import os
 
 INPUT_DIR = Path("data/processed/extracted_text")
 OUTPUT_DIR = Path("data/processed/chunks")
 CHUNKS_FILE = OUTPUT_DIR / "all_chunks.jsonl"
+PENDING_PER_WORKER = 4  # Documents queued per worker process; bounds chunks held in memory
 
 
 @dataclass
@@ -35,25 +40,55 @@ class Chunk:
     operations: list
 
 
-def create_chunk_id(source_file: str, chunk_index: int, text: str) -> str:
-    """Create a unique chunk ID."""
-    content_hash = hashlib.md5(text.encode()).hexdigest()[:8]
-    return f"{Path(source_file).stem}_{chunk_index}_{content_hash}"
+# ASCII characters Pinecone IDs can't take, mapped to underscore
+_UNSAFE_ID_CHARS = str.maketrans({c: '_' for c in map(chr, range(128)) if not (c.isalnum() or c in '-_')})
+
+
+def create_chunk_id(source_file: str, chunk_index: int, text: str, id_scheme: str = "md5") -> str:
+    """Create a unique, Pinecone-safe chunk ID (so ingestion can upsert it as-is)."""
+    if id_scheme == "blake3":
+        import blake3  # pip install blake3
+        content_hash = blake3.blake3(text.encode()).hexdigest()[:8]
+    else:
+        content_hash = hashlib.md5(text.encode()).hexdigest()[:8]
+    stem = Path(source_file).stem
+    if not stem.isascii():
+        stem = stem.encode('ascii', 'replace').decode('ascii')  # one '?' per char
+    return f"{stem.translate(_UNSAFE_ID_CHARS)}_{chunk_index}_{content_hash}"
+
+
+# Sentence boundaries, and the endings that must not be treated as one
+# (abbreviations and numbers followed by a period)
+_SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+')
+_NO_BREAK_BEFORE = re.compile(r'(?:\b(?:Mr|Mrs|Ms|Dr|Prof|Inc|Ltd|Corp|vs|etc|e\.g|i\.e)|\d)\.$')
+
+# clean_text patterns
+_PAGE_MARKER = re.compile(r'\[Page \d+\]\n*')
+_EXTRA_NEWLINES = re.compile(r'\n{3,}')
+_EXTRA_SPACES = re.compile(r' {2,}')
+_PAGE_FOOTER = re.compile(r'^\s*Page \d+ of \d+\s*$', flags=re.MULTILINE)
 
 
 def split_into_sentences(text: str) -> list[str]:
     """Split text into sentences."""
-    # Handle common abbreviations to avoid false splits
-    text = re.sub(r'\b(Mr|Mrs|Ms|Dr|Prof|Inc|Ltd|Corp|vs|etc|e\.g|i\.e)\.\s', r'\1<PERIOD> ', text)
-    text = re.sub(r'(\d)\.\s', r'\1<PERIOD> ', text)  # Numbers followed by period
-    
-    # Split on sentence boundaries
-    sentences = re.split(r'(?<=[.!?])\s+', text)
-    
-    # Restore periods
-    sentences = [s.replace('<PERIOD>', '.') for s in sentences]
-    
-    return [s.strip() for s in sentences if s.strip()]
+    sentences = []
+    start = 0
+    
+    # Single pass over candidate boundaries, skipping abbreviations
+    for match in _SENTENCE_BOUNDARY.finditer(text):
+        end = match.start()
+        if _NO_BREAK_BEFORE.search(text, max(0, end - 8), end):
+            continue
+        sentence = text[start:end].strip()
+        if sentence:
+            sentences.append(sentence)
+        start = match.end()
+    
+    tail = text[start:].strip()
+    if tail:
+        sentences.append(tail)
+    
+    return sentences
 
 
 def chunk_text(
@@ -73,7 +108,10 @@ def chunk_text(
     
     sentences = split_into_sentences(text)
     
-    current_chunk = []
+    # Sentences in the current chunk with their lengths; current_length is
+    # the running sum of (length + 1 separator) so nothing is re-summed
+    current_chunk = deque()
+    current_lengths = deque()
     current_length = 0
     char_position = 0
     chunk_start = 0
@@ -87,22 +125,15 @@ def chunk_text(
             chunk_text = ' '.join(current_chunk)
             yield chunk_text, chunk_start, char_position
             
-            # Start new chunk with overlap
-            overlap_length = 0
-            overlap_sentences = []
-            
-            for s in reversed(current_chunk):
-                if overlap_length + len(s) < chunk_overlap:
-                    overlap_sentences.insert(0, s)
-                    overlap_length += len(s) + 1
-                else:
-                    break
+            # Start new chunk with overlap: keep the longest tail that fits
+            while current_chunk and current_length > chunk_overlap:
+                current_length -= current_lengths.popleft() + 1
+                current_chunk.popleft()
             
-            current_chunk = overlap_sentences
-            current_length = sum(len(s) for s in current_chunk) + len(current_chunk)
             chunk_start = char_position - current_length
         
         current_chunk.append(sentence)
+        current_lengths.append(sentence_length)
         current_length += sentence_length + 1
         char_position += sentence_length + 1
     
@@ -116,14 +147,14 @@ def chunk_text(
 def clean_text(text: str) -> str:
     """Clean extracted text for better chunking."""
     # Remove page markers we added
-    text = re.sub(r'\[Page \d+\]\n*', '\n\n', text)
+    text = _PAGE_MARKER.sub('\n\n', text)
     
     # Normalize whitespace
-    text = re.sub(r'\n{3,}', '\n\n', text)
-    text = re.sub(r' {2,}', ' ', text)
+    text = _EXTRA_NEWLINES.sub('\n\n', text)
+    text = _EXTRA_SPACES.sub(' ', text)
     
     # Remove headers/footers (common patterns)
-    text = re.sub(r'^\s*Page \d+ of \d+\s*$', '', text, flags=re.MULTILINE)
+    text = _PAGE_FOOTER.sub('', text)
     
     return text.strip()
 
@@ -133,6 +164,7 @@ def process_document(
     meta_file: Path,
     chunk_size: int,
     chunk_overlap: int,
+    id_scheme: str = "md5",
 ) -> list[Chunk]:
     """Process a single document into chunks."""
     
@@ -140,7 +172,7 @@ def process_document(
     text = text_file.read_text(encoding='utf-8')
     
     try:
-        metadata = json.loads(meta_file.read_text(encoding='utf-8'))
+        metadata = orjson.loads(meta_file.read_bytes())
     except:
         metadata = {}
     
@@ -157,7 +189,7 @@ def process_document(
     
     for i, (chunk_text_content, char_start, char_end) in enumerate(chunk_list):
         chunk = Chunk(
-            chunk_id=create_chunk_id(text_file.name, i, chunk_text_content),
+            chunk_id=create_chunk_id(text_file.name, i, chunk_text_content, id_scheme),
             text=chunk_text_content,
             source_file=text_file.stem,
             source=metadata.get("source", "unknown"),
@@ -180,6 +212,9 @@ def main():
     parser.add_argument("--chunk-size", type=int, default=1000, help="Target chunk size in characters")
     parser.add_argument("--overlap", type=int, default=200, help="Overlap between chunks")
     parser.add_argument("--source", type=str, default=None, help="Only process specific source")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of worker processes")
+    parser.add_argument("--id-scheme", type=str, default="md5", choices=["md5", "blake3"],
+                        help="Content hash for chunk IDs (blake3 is faster but changes IDs; rebuild the index)")
     args = parser.parse_args()
     
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
@@ -189,6 +224,7 @@ def main():
     print("=" * 60)
     print(f"Chunk size: {args.chunk_size} chars")
     print(f"Overlap: {args.overlap} chars")
+    print(f"Workers: {args.workers}")
     
     # Find all text files
     text_files = list(INPUT_DIR.glob("*.txt"))
@@ -202,59 +238,75 @@ def main():
         print("No text files found. Run extract_text.py first.")
         return
     
-    # Process all documents
-    all_chunks = []
-    doc_count = 0
+    # Process all documents, streaming chunks to JSONL as they are produced
+    print(f"\nWriting chunks to {CHUNKS_FILE}...")
     
-    for i, text_file in enumerate(text_files):
-        meta_file = text_file.with_suffix('.json')
-        
-        if not meta_file.exists():
-            meta_file = None
-        
-        chunks = process_document(text_file, meta_file, args.chunk_size, args.overlap)
-        
-        if chunks:
-            all_chunks.extend(chunks)
-            doc_count += 1
+    doc_count = 0
+    total_chunks = 0
+    total_chars = 0
+    by_source = {}
+    by_doc_type = {}
+    
+    with open(CHUNKS_FILE, 'wb') as f, \
+            ProcessPoolExecutor(max_workers=args.workers) as executor:
+        # Only a few documents per worker are in flight at once, so each
+        # document's chunks are freed as soon as they are written
+        max_pending = PENDING_PER_WORKER * args.workers
+        files = iter(text_files)
+        pending = set()
+        processed = 0
+        while True:
+            for text_file in islice(files, max_pending - len(pending)):
+                meta_file = text_file.with_suffix('.json')
+                
+                if not meta_file.exists():
+                    meta_file = None
+                
+                pending.add(executor.submit(process_document, text_file, meta_file,
+                                            args.chunk_size, args.overlap, args.id_scheme))
+            if not pending:
+                break
             
-            if (i + 1) % 100 == 0:
-                print(f"Processed {i + 1}/{len(text_files)} documents, {len(all_chunks)} chunks so far...")
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                chunks = future.result()
+                processed += 1
+                
+                if chunks:
+                    for chunk in chunks:
+                        f.write(orjson.dumps(chunk) + b'\n')  # orjson serializes dataclasses natively
+                        total_chars += len(chunk.text)
+                        by_source[chunk.source] = by_source.get(chunk.source, 0) + 1
+                        by_doc_type[chunk.doc_type] = by_doc_type.get(chunk.doc_type, 0) + 1
+                    total_chunks += len(chunks)
+                    doc_count += 1
+                
+                if processed % 100 == 0:
+                    print(f"Processed {processed}/{len(text_files)} documents, {total_chunks} chunks so far...")
     
     print(f"\nProcessed {doc_count} documents")
-    print(f"Total chunks: {len(all_chunks)}")
-    
-    # Save chunks as JSONL
-    print(f"\nSaving to {CHUNKS_FILE}...")
-    
-    with open(CHUNKS_FILE, 'w', encoding='utf-8') as f:
-        for chunk in all_chunks:
-            f.write(json.dumps(asdict(chunk)) + '\n')
+    print(f"Total chunks: {total_chunks}")
     
     # Also save summary stats
     stats = {
         "total_documents": doc_count,
-        "total_chunks": len(all_chunks),
+        "total_chunks": total_chunks,
         "chunk_size": args.chunk_size,
         "overlap": args.overlap,
-        "avg_chunk_length": sum(len(c.text) for c in all_chunks) // len(all_chunks) if all_chunks else 0,
-        "by_source": {},
-        "by_doc_type": {},
+        "avg_chunk_length": total_chars // total_chunks if total_chunks else 0,
+        "by_source": by_source,
+        "by_doc_type": by_doc_type,
     }
     
-    for chunk in all_chunks:
-        stats["by_source"][chunk.source] = stats["by_source"].get(chunk.source, 0) + 1
-        stats["by_doc_type"][chunk.doc_type] = stats["by_doc_type"].get(chunk.doc_type, 0) + 1
-    
     stats_file = OUTPUT_DIR / "chunking_stats.json"
-    stats_file.write_text(json.dumps(stats, indent=2))
+    stats_file.write_bytes(orjson.dumps(stats, option=orjson.OPT_INDENT_2))
     
     # Summary
     print("\n" + "=" * 60)
     print("CHUNKING COMPLETE")
     print("=" * 60)
     print(f"Documents processed: {doc_count}")
-    print(f"Total chunks: {len(all_chunks)}")
+    print(f"Total chunks: {total_chunks}")
     print(f"Average chunk length: {stats['avg_chunk_length']} chars")
     print(f"\nChunks file: {CHUNKS_FILE.absolute()}")
     
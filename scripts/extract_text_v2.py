@@ -10,40 +10,147 @@ Handles:
 import pymupdf  # PyMuPDF (fitz)
 from pathlib import Path
 import json
+import orjson
 import re
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import Counter
+from typing import Iterator
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 import argparse
+import os
 
 RAW_DIR = Path("data/raw")
 OUTPUT_DIR = Path("data/processed/extracted_text")
 MANIFEST_FILE = Path("data/processed/manifest.json")
 
+CLASSIFY_CHARS = 5000  # Leading characters classify_document looks at
+MANIFEST_READ_THREADS = 16  # Threads for reading sidecars the manifest doesn't know
 
-def classify_document(text: str, filename: str, source_dir: str) -> dict:
-    """Classify document type and extract metadata."""
-    text_lower = text.lower()[:5000]
+
+# classify_document tags. Single words are looked up in the set of words in
+# the text (one pass, like an Aho-Corasick scan over a dictionary); phrases,
+# prefixes and the odd unanchored pattern fall back to a regex that is only
+# run when its literal appears in the text at all.
+_WORD_RE = re.compile(r'\w+')
+
+_EQUIPMENT_WORDS = {
+    'bop': 'BOP', 'bops': 'BOP',
+    'esp': 'ESP', 'esps': 'ESP',
+    'compressor': 'compressor',
+    'wellhead': 'wellhead',
+    'pipeline': 'pipeline',
+    'valve': 'valve',
+    'pump': 'pump',
+    'separator': 'separator',
+    'tank': 'tank',
+    'crane': 'crane',
+    'scaffold': 'scaffold',
+    'generator': 'generator',
+    'turbine': 'turbine',
+    'boiler': 'boiler',
+    'flare': 'flare',
+    'casing': 'casing',
+    'tubing': 'tubing',
+    'packer': 'packer',
+    'choke': 'choke',
+    'motor': 'motor',
+    'seal': 'seal',
+    'cable': 'cable',
+}
+_EQUIPMENT_PATTERNS = [
+    ('blowout preventer', re.compile(r'\bblowout preventers?\b'), 'BOP'),
+    ('electric submersible pump', re.compile(r'\belectric submersible pumps?\b'), 'ESP'),
+    ('heater', re.compile(r'\bheater.treater\b'), 'heater_treater'),
+    ('heat exchanger', re.compile(r'\bheat exchanger\b'), 'heat_exchanger'),
+    ('drill string', re.compile(r'\bdrill string\b'), 'drill_string'),
+    ('perforat', re.compile(r'\bperforat'), 'perforation'),
+    ('christmas tree', re.compile(r'\bchristmas tree\b'), 'christmas_tree'),
+]
+
+_HAZARD_WORDS = {
+    'h2s': 'H2S',
+    'fire': 'fire',
+    'explosion': 'explosion',
+    'fall': 'fall',
+    'corrosion': 'corrosion',
+    'pressure': 'pressure',
+    'release': 'release',
+    'fatigue': 'fatigue',
+    'fracture': 'fracture',
+    'scale': 'scale',
+    'wax': 'wax',
+    'hydrate': 'hydrate',
+    'erosion': 'erosion',
+}
+_HAZARD_PATTERNS = [
+    ('hydrogen sulfide', re.compile(r'hydrogen sulfide'), 'H2S'),
+    ('struck', re.compile(r'\bstruck.by\b'), 'struck_by'),
+    ('caught', re.compile(r'\bcaught.in\b'), 'caught_in'),
+    ('electr', re.compile(r'\belectr'), 'electrical'),
+    ('confined space', re.compile(r'\bconfined space\b'), 'confined_space'),
+    ('leak', re.compile(r'leak\b'), 'release'),
+    ('gas lock', re.compile(r'\bgas lock'), 'gas_lock'),
+]
+
+_OPERATION_WORDS = {
+    'drilling': 'drilling',
+    'production': 'production',
+    'completion': 'completions',
+    'workover': 'workover',
+    'pipeline': 'midstream',
+    'offshore': 'offshore',
+    'onshore': 'onshore',
+    'stimulation': 'stimulation',
+}
+_OPERATION_PATTERNS = [
+    ('midstream', re.compile(r'midstream\b'), 'midstream'),
+    ('refin', re.compile(r'\brefin'), 'downstream'),
+    ('artificial lift', re.compile(r'\bartificial lift\b'), 'artificial_lift'),
+    ('well control', re.compile(r'\bwell control\b'), 'well_control'),
+    ('fracturing', re.compile(r'fracturing\b'), 'stimulation'),
+    ('acidizing', re.compile(r'acidizing\b'), 'stimulation'),
+]
+
+
+# (token in the source directory name, source tag), in priority order
+_SOURCE_TOKENS = (
+    ("bsee", "bsee"),
+    ("phmsa", "phmsa"),
+    ("osha", "osha"),
+    ("csb", "csb"),
+    ("petrowiki", "petrowiki"),
+    ("slb", "slb"),
+    ("glossary", "slb"),
+    ("iadc", "iadc"),
+    ("esp", "equipment_manual"),
+)
+
+
+def find_tags(words: set, text_lower: str, tag_words: dict, tag_patterns: list) -> set:
+    """Collect the tags whose word or pattern occurs in the (lower-cased) text."""
+    tags = {tag_words[word] for word in words & tag_words.keys()}
+    for literal, pattern, name in tag_patterns:
+        if name not in tags and literal in text_lower and pattern.search(text_lower):
+            tags.add(name)
+    return tags
+
+
+def classify_document(head: str, filename: str, source_dir: str) -> dict:
+    """Classify document type and extract metadata.
+    
+    Only the start of the document is used; pass its first CLASSIFY_CHARS
+    characters as `head`.
+    """
+    text_lower = head.lower()
     filename_lower = filename.lower()
     source_lower = source_dir.lower()
     
-    # Source classification
-    source = "unknown"
-    if "bsee" in source_lower:
-        source = "bsee"
-    elif "phmsa" in source_lower:
-        source = "phmsa"
-    elif "osha" in source_lower:
-        source = "osha"
-    elif "csb" in source_lower:
-        source = "csb"
-    elif "petrowiki" in source_lower:
-        source = "petrowiki"
-    elif "slb" in source_lower or "glossary" in source_lower:
-        source = "slb"
-    elif "iadc" in source_lower:
-        source = "iadc"
-    elif "esp" in source_lower or "pump" in filename_lower:
-        source = "equipment_manual"
+    # Source classification: first token found in the directory name wins,
+    # then pump manuals by filename
+    source = next(
+        (tag for token, tag in _SOURCE_TOKENS if token in source_lower),
+        "equipment_manual" if "pump" in filename_lower else "unknown",
+    )
     
     # Document type classification
     doc_type = "general"
@@ -68,98 +175,24 @@ def classify_document(text: str, filename: str, source_dir: str) -> dict:
     elif "well control" in text_lower:
         doc_type = "well_control"
     
+    words = set(_WORD_RE.findall(text_lower))
+    
     # Equipment/topic extraction
-    equipment = []
-    equipment_patterns = [
-        (r'\b(BOP|blowout preventer)s?\b', 'BOP'),
-        (r'\b(ESP|electric submersible pump)s?\b', 'ESP'),
-        (r'\bcompressor\b', 'compressor'),
-        (r'\bwellhead\b', 'wellhead'),
-        (r'\bpipeline\b', 'pipeline'),
-        (r'\bvalve\b', 'valve'),
-        (r'\bpump\b', 'pump'),
-        (r'\bseparator\b', 'separator'),
-        (r'\bheater.treater\b', 'heater_treater'),
-        (r'\btank\b', 'tank'),
-        (r'\bcrane\b', 'crane'),
-        (r'\bscaffold\b', 'scaffold'),
-        (r'\bgenerator\b', 'generator'),
-        (r'\bturbine\b', 'turbine'),
-        (r'\bheat exchanger\b', 'heat_exchanger'),
-        (r'\bboiler\b', 'boiler'),
-        (r'\bflare\b', 'flare'),
-        (r'\bdrill string\b', 'drill_string'),
-        (r'\bcasing\b', 'casing'),
-        (r'\btubing\b', 'tubing'),
-        (r'\bpacker\b', 'packer'),
-        (r'\bperforat', 'perforation'),
-        (r'\bchristmas tree\b', 'christmas_tree'),
-        (r'\bchoke\b', 'choke'),
-        (r'\bmotor\b', 'motor'),
-        (r'\bseal\b', 'seal'),
-        (r'\bcable\b', 'cable'),
-    ]
-    for pattern, name in equipment_patterns:
-        if re.search(pattern, text_lower):
-            equipment.append(name)
+    equipment = find_tags(words, text_lower, _EQUIPMENT_WORDS, _EQUIPMENT_PATTERNS)
     
     # Hazard classification
-    hazards = []
-    hazard_patterns = [
-        (r'\bh2s\b|hydrogen sulfide', 'H2S'),
-        (r'\bfire\b', 'fire'),
-        (r'\bexplosion\b', 'explosion'),
-        (r'\bfall\b', 'fall'),
-        (r'\bstruck.by\b', 'struck_by'),
-        (r'\bcaught.in\b', 'caught_in'),
-        (r'\belectr', 'electrical'),
-        (r'\bconfined space\b', 'confined_space'),
-        (r'\bcorrosion\b', 'corrosion'),
-        (r'\bpressure\b', 'pressure'),
-        (r'\brelease\b|leak\b', 'release'),
-        (r'\bfatigue\b', 'fatigue'),
-        (r'\bfracture\b', 'fracture'),
-        (r'\bgas lock', 'gas_lock'),
-        (r'\bscale\b', 'scale'),
-        (r'\bwax\b', 'wax'),
-        (r'\bhydrate\b', 'hydrate'),
-        (r'\berosion\b', 'erosion'),
-    ]
-    for pattern, name in hazard_patterns:
-        if re.search(pattern, text_lower):
-            hazards.append(name)
+    hazards = find_tags(words, text_lower, _HAZARD_WORDS, _HAZARD_PATTERNS)
     
     # Operation type
-    operations = []
-    if re.search(r'\bdrilling\b', text_lower):
-        operations.append("drilling")
-    if re.search(r'\bproduction\b', text_lower):
-        operations.append("production")
-    if re.search(r'\bcompletion\b', text_lower):
-        operations.append("completions")
-    if re.search(r'\bworkover\b', text_lower):
-        operations.append("workover")
-    if re.search(r'\bpipeline\b|midstream\b', text_lower):
-        operations.append("midstream")
-    if re.search(r'\brefin', text_lower):
-        operations.append("downstream")
-    if re.search(r'\boffshore\b', text_lower):
-        operations.append("offshore")
-    if re.search(r'\bonshore\b', text_lower):
-        operations.append("onshore")
-    if re.search(r'\bartificial lift\b', text_lower):
-        operations.append("artificial_lift")
-    if re.search(r'\bwell control\b', text_lower):
-        operations.append("well_control")
-    if re.search(r'\bstimulation\b|fracturing\b|acidizing\b', text_lower):
-        operations.append("stimulation")
+    operations = find_tags(words, text_lower, _OPERATION_WORDS, _OPERATION_PATTERNS)
     
     return {
         "source": source,
         "doc_type": doc_type,
-        "equipment": list(set(equipment)),
-        "hazards": list(set(hazards)),
-        "operations": list(set(operations)),
+        # Sorted so the metadata is deterministic across runs
+        "equipment": sorted(equipment),
+        "hazards": sorted(hazards),
+        "operations": sorted(operations),
     }
 
 
@@ -169,10 +202,21 @@ def extract_text_from_pdf(pdf_path: Path) -> tuple[str, dict]:
         doc = pymupdf.open(pdf_path)
         
         text_parts = []
-        for page_num, page in enumerate(doc):
-            page_text = page.get_text()
-            if page_text.strip():
+        word_count = 0  # Counted per page so the token list never spans the whole PDF
+        page_errors = []
+        for page_num in range(doc.page_count):
+            # One TextPage per page with get_text()'s default text flags; each
+            # page is released when the next one is loaded
+            try:
+                page = doc.load_page(page_num)
+                page_text = page.get_textpage(flags=pymupdf.TEXTFLAGS_TEXT).extractText()
+            except Exception as e:
+                # Keep the rest of the document if one page is broken
+                page_errors.append({"page": page_num + 1, "error": str(e)})
+                continue
+            if page_text and not page_text.isspace():  # no stripped copy
                 text_parts.append(f"[Page {page_num + 1}]\n{page_text}")
+                word_count += len(page_text.split()) + 2  # + the "[Page N]" header
         
         full_text = "\n\n".join(text_parts)
         
@@ -182,16 +226,19 @@ def extract_text_from_pdf(pdf_path: Path) -> tuple[str, dict]:
             "filename": pdf_path.name,
             "source_path": str(pdf_path),
             "file_type": "pdf",
-            "page_count": len(doc),
+            "page_count": doc.page_count,
             "char_count": len(full_text),
-            "word_count": len(full_text.split()),
+            "word_count": word_count,
             "pdf_title": pdf_metadata.get("title", ""),
             "pdf_author": pdf_metadata.get("author", ""),
             "extracted_at": datetime.now().isoformat(),
         }
         
+        if page_errors:
+            metadata["partial_errors"] = page_errors
+        
         source_dir = pdf_path.parent.name
-        classification = classify_document(full_text, pdf_path.name, source_dir)
+        classification = classify_document(full_text[:CLASSIFY_CHARS], pdf_path.name, source_dir)
         metadata.update(classification)
         
         doc.close()
@@ -216,7 +263,7 @@ def extract_text_from_txt(txt_path: Path) -> tuple[str, dict]:
         }
         
         source_dir = txt_path.parent.name
-        classification = classify_document(text, txt_path.name, source_dir)
+        classification = classify_document(text[:CLASSIFY_CHARS], txt_path.name, source_dir)
         metadata.update(classification)
         
         return text, metadata
@@ -230,12 +277,12 @@ def extract_glossary_from_jsonl(jsonl_path: Path) -> list[tuple[str, dict]]:
     results = []
     
     try:
-        with open(jsonl_path, 'r', encoding='utf-8') as f:
+        with open(jsonl_path, 'rb') as f:
             for line in f:
                 if not line.strip():
                     continue
                 
-                entry = json.loads(line)
+                entry = orjson.loads(line)
                 term = entry.get('term', 'Unknown')
                 definition = entry.get('definition', '')
                 related = entry.get('related_terms', [])
@@ -269,6 +316,17 @@ def extract_glossary_from_jsonl(jsonl_path: Path) -> list[tuple[str, dict]]:
     return results
 
 
+def write_bytes(path: Path, data: bytes):
+    """Write pre-encoded bytes with raw os calls (no text or buffer layer)."""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+
 def process_file(file_path: Path, output_dir: Path) -> dict:
     """Process a single file and save results."""
     
@@ -285,31 +343,64 @@ def process_file(file_path: Path, output_dir: Path) -> dict:
     output_name = file_path.stem
     
     text_file = output_dir / f"{output_name}.txt"
-    text_file.write_text(text, encoding='utf-8')
+    # 'replace' so a stray surrogate from the PDF text layer can't lose the file
+    write_bytes(text_file, text.encode('utf-8', errors='replace'))
     
     meta_file = output_dir / f"{output_name}.json"
-    meta_file.write_text(json.dumps(metadata, indent=2), encoding='utf-8')
+    write_bytes(meta_file, orjson.dumps(metadata))
     
     return {
         "status": "success",
         "file": file_path.name,
         "chars": metadata["char_count"],
         "doc_type": metadata.get("doc_type", "unknown"),
+        "source": metadata.get("source", "unknown"),
     }
 
 
+# Runs of characters that aren't safe in filenames, whitespace and underscores
+# collapse to a single underscore
+_UNSAFE_FILENAME_RUN = re.compile(r'[<>:"/\\|?*\s_]+')
+
+
 def sanitize_filename(name: str, max_length: int = 80) -> str:
     """Create safe filename."""
-    safe = re.sub(r'[<>:"/\\|?*]', '_', name)
-    safe = re.sub(r'\s+', '_', safe)
-    safe = re.sub(r'_+', '_', safe)
+    safe = _UNSAFE_FILENAME_RUN.sub('_', name)
     safe = safe.strip('_.')
     return safe[:max_length]
 
 
+def walk_files(root: Path) -> Iterator[Path]:
+    """Yield every file under root, walking each directory once with os.scandir."""
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    stack.append(entry.path)
+                elif entry.is_file():
+                    yield Path(entry.path)
+
+
+def read_source(meta_file: Path) -> str | None:
+    """Read the source tag from a metadata sidecar (None if unreadable)."""
+    try:
+        return orjson.loads(meta_file.read_bytes()).get("source", "unknown")
+    except (OSError, ValueError):
+        return None
+
+
+def load_manifest_documents() -> dict:
+    """Per-document sources ({stem: source}) recorded by the previous manifest."""
+    try:
+        return json.loads(MANIFEST_FILE.read_bytes()).get("documents", {})
+    except (OSError, ValueError):
+        return {}
+
+
 def main():
     parser = argparse.ArgumentParser(description="Extract text from O&G documents")
-    parser.add_argument("--workers", type=int, default=4, help="Number of parallel workers")
+    parser.add_argument("--workers", type=int, default=4, help="Number of worker processes")
     parser.add_argument("--source", type=str, default=None, help="Only process specific source directory")
     args = parser.parse_args()
     
@@ -319,32 +410,52 @@ def main():
     print("Text Extraction for O&G RAG (Phase 2 Update)")
     print("=" * 60)
     
-    # Find all files to process
-    all_files = []
+    # Find all files to process in a single walk of the raw tree
+    pdf_files = []
+    txt_files = []
+    jsonl_files = []  # Glossary files
     
-    # PDFs
-    if args.source:
-        pdf_files = list(RAW_DIR.glob(f"{args.source}*/**/*.pdf"))
-        txt_files = list(RAW_DIR.glob(f"{args.source}*/**/*.txt"))
-    else:
-        pdf_files = list(RAW_DIR.glob("**/*.pdf"))
-        txt_files = [f for f in RAW_DIR.glob("**/*.txt") if 'extracted_text' not in str(f)]
+    for path in walk_files(RAW_DIR):
+        if path.suffix == '.jsonl':
+            jsonl_files.append(path)
+            continue
+        if args.source:
+            parts = path.relative_to(RAW_DIR).parts
+            if len(parts) < 2 or not parts[0].startswith(args.source):
+                continue
+        if path.suffix == '.pdf':
+            pdf_files.append(path)
+        elif path.suffix == '.txt' and (args.source or 'extracted_text' not in str(path)):
+            txt_files.append(path)
     
     all_files = pdf_files + txt_files
     
     print(f"\nFound {len(pdf_files)} PDFs and {len(txt_files)} text files")
-    
-    # Find JSONL glossary files
-    jsonl_files = list(RAW_DIR.glob("**/*.jsonl"))
     print(f"Found {len(jsonl_files)} JSONL files (glossary)")
     
-    # Check existing
-    existing = set(f.stem for f in OUTPUT_DIR.glob("*.txt"))
-    to_process = [f for f in all_files if f.stem not in existing]
+    # Check existing: an output counts only if both the text and metadata
+    # files are there and the text is newer than its source
+    meta_stems = {f.stem for f in OUTPUT_DIR.glob("*.json")}
+    existing = {f.stem: f.stat().st_mtime for f in OUTPUT_DIR.glob("*.txt") if f.stem in meta_stems}
+    to_process = [f for f in all_files if existing.get(f.stem, 0) < f.stat().st_mtime]
     
     print(f"Already processed: {len(existing)}")
     print(f"To process: {len(to_process)}")
     
+    # Source of every output on disk, kept up to date as files are written so
+    # the manifest doesn't have to re-read each sidecar. Outputs the previous
+    # manifest doesn't know about are read once here, on threads since the
+    # reads are I/O bound.
+    previous = load_manifest_documents()
+    doc_sources = {stem: previous[stem] for stem in existing if stem in previous}
+    unknown = list(existing.keys() - doc_sources.keys())
+    if unknown:
+        with ThreadPoolExecutor(max_workers=MANIFEST_READ_THREADS) as executor:
+            sources = executor.map(read_source, (OUTPUT_DIR / f"{stem}.json" for stem in unknown))
+            for stem, source in zip(unknown, sources):
+                if source is not None:
+                    doc_sources[stem] = source
+    
     # Process regular files
     if to_process:
         print(f"\nProcessing files with {args.workers} workers...")
@@ -353,7 +464,7 @@ def main():
         errors = 0
         total_chars = 0
         
-        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
             futures = {executor.submit(process_file, f, OUTPUT_DIR): f for f in to_process}
             
             for i, future in enumerate(as_completed(futures)):
@@ -362,6 +473,7 @@ def main():
                 if result["status"] == "success":
                     success += 1
                     total_chars += result["chars"]
+                    doc_sources[futures[future].stem] = result["source"]
                     if (i + 1) % 50 == 0:
                         print(f"[{i+1}/{len(to_process)}] Processed {success} files...")
                 elif result["status"] == "error":
@@ -374,6 +486,7 @@ def main():
     if jsonl_files:
         print("\nProcessing glossary files...")
         glossary_count = 0
+        writes: list[tuple[Path, bytes]] = []  # Encoded up front, flushed in one sweep
         
         for jsonl_file in jsonl_files:
             entries = extract_glossary_from_jsonl(jsonl_file)
@@ -384,45 +497,35 @@ def main():
                 if safe_name in existing:
                     continue
                 
-                text_file = OUTPUT_DIR / f"{safe_name}.txt"
-                meta_file = OUTPUT_DIR / f"{safe_name}.json"
-                
-                text_file.write_text(text, encoding='utf-8')
-                meta_file.write_text(json.dumps(metadata, indent=2), encoding='utf-8')
+                writes.append((OUTPUT_DIR / f"{safe_name}.txt", text.encode('utf-8')))
+                writes.append((OUTPUT_DIR / f"{safe_name}.json", orjson.dumps(metadata)))
+                doc_sources[safe_name] = metadata["source"]
                 
                 glossary_count += 1
         
+        for path, data in writes:
+            write_bytes(path, data)
+        
         print(f"Glossary terms extracted: {glossary_count}")
     
     # Build manifest
     print("\nBuilding manifest...")
     
-    all_processed = list(OUTPUT_DIR.glob("*.txt"))
-    
     manifest = {
         "extraction_date": datetime.now().isoformat(),
-        "total_files": len(all_processed),
-        "sources": {},
+        "total_files": len(doc_sources),
+        "sources": dict(Counter(doc_sources.values())),
+        "documents": doc_sources,
     }
     
-    for txt_file in all_processed:
-        meta_file = txt_file.with_suffix('.json')
-        if meta_file.exists():
-            try:
-                meta = json.loads(meta_file.read_text())
-                source = meta.get("source", "unknown")
-                manifest["sources"][source] = manifest["sources"].get(source, 0) + 1
-            except:
-                pass
-    
     MANIFEST_FILE.parent.mkdir(parents=True, exist_ok=True)
-    MANIFEST_FILE.write_text(json.dumps(manifest, indent=2))
+    MANIFEST_FILE.write_bytes(json.dumps(manifest, indent=2).encode('utf-8'))
     
     # Summary
     print("\n" + "=" * 60)
     print("EXTRACTION COMPLETE")
     print("=" * 60)
-    print(f"Total documents: {len(all_processed)}")
+    print(f"Total documents: {len(doc_sources)}")
     print(f"\nBy source:")
     for source, count in sorted(manifest["sources"].items()):
         print(f"  {source}: {count}")
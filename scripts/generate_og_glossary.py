@@ -6,9 +6,15 @@ No scraping required - uses embedded expert knowledge
 """
 
 from pathlib import Path
-import json
+import orjson
+import argparse
+from collections import defaultdict
+from operator import itemgetter
 
 OUTPUT_DIR = Path("data/raw/og_glossary")
+JSONL_FILE = OUTPUT_DIR / "og_glossary.jsonl"
+TEXT_FILE = OUTPUT_DIR / "og_glossary.txt"
+ENTRY_SEPARATOR = "-" * 40 + "\n\n"
 
 # Curated O&G terminology with definitions
 # Sources: SPE, API, IADC, industry standard references
@@ -246,57 +252,65 @@ OG_GLOSSARY = [
 ]
 
 
+def outputs_up_to_date() -> bool:
+    """True if both outputs were written after this file (the glossary source) last changed."""
+    source_mtime = Path(__file__).stat().st_mtime
+    return all(f.exists() and f.stat().st_mtime >= source_mtime for f in (JSONL_FILE, TEXT_FILE))
+
+
 def main():
-    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    parser = argparse.ArgumentParser(description="Generate the curated O&G glossary files")
+    parser.add_argument("--force", action="store_true", help="Regenerate even if the outputs are up to date")
+    args = parser.parse_args()
     
     print("=" * 60)
     print("O&G Terminology Database Generator")
     print("=" * 60)
     print(f"Terms in database: {len(OG_GLOSSARY)}")
     
+    # The glossary is static data; only re-encode it when this file changes
+    if not args.force and outputs_up_to_date():
+        print("\nOutputs are up to date (use --force to regenerate):")
+        print(f"  {JSONL_FILE}")
+        print(f"  {TEXT_FILE}")
+        return
+    
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    
+    # Group by category once, each category sorted by term
+    categories = defaultdict(list)
+    for entry in OG_GLOSSARY:
+        categories[entry['category']].append(entry)
+    for entries in categories.values():
+        entries.sort(key=itemgetter('term'))
+    
     # Save as JSONL for processing
-    jsonl_file = OUTPUT_DIR / "og_glossary.jsonl"
-    with open(jsonl_file, 'w', encoding='utf-8') as f:
-        for entry in OG_GLOSSARY:
-            f.write(json.dumps(entry) + '\n')
+    JSONL_FILE.write_bytes(b''.join(orjson.dumps(entry) + b'\n' for entry in OG_GLOSSARY))
     
-    # Save as readable text file
-    text_file = OUTPUT_DIR / "og_glossary.txt"
-    with open(text_file, 'w', encoding='utf-8') as f:
-        f.write("# Oil & Gas Technical Glossary\n\n")
-        f.write("Curated definitions from SPE, API, IADC, and industry references\n\n")
-        f.write("=" * 60 + "\n\n")
+    # Save as readable text file, built in memory and written once
+    parts = [
+        "# Oil & Gas Technical Glossary\n\n",
+        "Curated definitions from SPE, API, IADC, and industry references\n\n",
+        "=" * 60 + "\n\n",
+    ]
+    for cat in sorted(categories.keys()):
+        parts.append(f"## {cat.upper().replace('_', ' ')}\n\n")
         
-        # Group by category
-        categories = {}
-        for entry in OG_GLOSSARY:
-            cat = entry['category']
-            if cat not in categories:
-                categories[cat] = []
-            categories[cat].append(entry)
-        
-        for cat in sorted(categories.keys()):
-            f.write(f"## {cat.upper().replace('_', ' ')}\n\n")
-            
-            for entry in sorted(categories[cat], key=lambda x: x['term']):
-                f.write(f"### {entry['term']}\n\n")
-                f.write(f"{entry['definition']}\n\n")
-                if entry.get('related'):
-                    f.write(f"*Related: {', '.join(entry['related'])}*\n\n")
-                f.write("-" * 40 + "\n\n")
+        for entry in categories[cat]:
+            parts.append(f"### {entry['term']}\n\n{entry['definition']}\n\n")
+            if entry.get('related'):
+                parts.append(f"*Related: {', '.join(entry['related'])}*\n\n")
+            parts.append(ENTRY_SEPARATOR)
+    TEXT_FILE.write_text("".join(parts), encoding='utf-8')
     
     # Summary
     print(f"\nSaved {len(OG_GLOSSARY)} terms to:")
-    print(f"  {jsonl_file}")
-    print(f"  {text_file}")
+    print(f"  {JSONL_FILE}")
+    print(f"  {TEXT_FILE}")
     
     print("\nTerms by category:")
-    categories = {}
-    for entry in OG_GLOSSARY:
-        cat = entry['category']
-        categories[cat] = categories.get(cat, 0) + 1
-    for cat, count in sorted(categories.items()):
-        print(f"  {cat}: {count}")
+    for cat, entries in sorted(categories.items()):
+        print(f"  {cat}: {len(entries)}")
 
 
 if __name__ == "__main__":
@@ -4,14 +4,19 @@ Pinecone Vector Store Ingestion for O&G RAG
 Embeds chunks and uploads to Pinecone for retrieval
 """
 
-import json
+import orjson
 from pathlib import Path
-from pinecone import Pinecone, ServerlessSpec
+from itertools import islice
+from typing import Iterator
+from pinecone import ServerlessSpec
+from pinecone.grpc import PineconeGRPC as Pinecone
 from sentence_transformers import SentenceTransformer
+import numpy as np
 import argparse
 from tqdm import tqdm
 import time
 import os
+import mmap
 
 os.environ['TF_ENABLE_ONEDNN_OPTS'] = '0'
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
@@ -24,14 +29,32 @@ API_KEY_FILE = PROJECT_ROOT / ".pinecone_api_key"
 INDEX_NAME = "og-rag"
 EMBEDDING_MODEL = "BAAI/bge-base-en-v1.5"  # 768 dims, excellent quality
 EMBEDDING_DIM = 768
+# FP32 ONNX graph for CPU ingestion (pip install sentence-transformers[onnx]);
+# same vectors as torch, so it shares the index. Exported on first use if missing.
+EMBEDDING_ONNX_FILE = "onnx/model.onnx"
 BATCH_SIZE = 100  # Pinecone upsert batch size
+UPSERT_THREADS = 4  # Concurrent async Pinecone upserts (gRPC futures)
+ENCODE_BATCH_SIZE = 128  # Encoder micro-batch; >= upsert batch so each batch is one forward pass
+METADATA_TEXT_BYTES = 8000  # Chunk text kept in metadata, in UTF-8 bytes
+
+# Model2Vec static embeddings (pip install model2vec) - kept in a separate index
+STATIC_INDEX_NAME = "og-rag-static"
+STATIC_EMBEDDING_MODEL = "minishlab/potion-base-8M"
+STATIC_EMBEDDING_DIM = 256
 
 # Add this function and use it on chunk_id before upsert
 
+# ASCII characters Pinecone IDs can't take, mapped to underscore
+_UNSAFE_ID_CHARS = str.maketrans({c: '_' for c in map(chr, range(128)) if not (c.isalnum() or c in '-_')})
+
+
 def sanitize_id(chunk_id: str) -> str:
     """Make chunk ID ASCII-safe for Pinecone."""
+    # chunk_documents.py now writes safe IDs; this still covers older chunk files.
     # Replace non-ASCII with underscore, keep alphanumeric and basic punctuation
-    return ''.join(c if c.isascii() and (c.isalnum() or c in '-_') else '_' for c in chunk_id)
+    if not chunk_id.isascii():
+        chunk_id = chunk_id.encode('ascii', 'replace').decode('ascii')  # one '?' per char
+    return chunk_id.translate(_UNSAFE_ID_CHARS)
 
 def load_api_key() -> str:
     """Load Pinecone API key from file."""
@@ -40,30 +63,63 @@ def load_api_key() -> str:
     return API_KEY_FILE.read_text().strip()
 
 
-def load_chunks(limit: int = None) -> list[dict]:
-    """Load chunks from JSONL file."""
-    chunks = []
-    with open(CHUNKS_FILE, 'r', encoding='utf-8') as f:
-        for i, line in enumerate(f):
-            if limit and i >= limit:
-                break
-            chunks.append(json.loads(line))
-    return chunks
+def count_chunks(limit: int = None) -> int:
+    """Count chunks in the JSONL file without parsing them."""
+    with open(CHUNKS_FILE, 'rb') as f:
+        total = sum(1 for _ in f)
+    return min(total, limit) if limit else total
 
 
-def create_index(pc: Pinecone, index_name: str, dimension: int):
-    """Create Pinecone index if it doesn't exist."""
-    existing = [idx.name for idx in pc.list_indexes()]
+def iter_chunks(limit: int = None) -> Iterator[dict]:
+    """Yield chunks from the JSONL file one at a time.
     
+    The file is memory-mapped and each line's bytes go straight to orjson,
+    skipping Python's line reader.
+    """
+    if CHUNKS_FILE.stat().st_size == 0:
+        return
+    with open(CHUNKS_FILE, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        start = 0
+        count = 0
+        while start < len(mm) and not (limit and count >= limit):
+            end = mm.find(b'\n', start)
+            if end < 0:
+                end = len(mm)
+            if end > start:
+                yield orjson.loads(mm[start:end])
+                count += 1
+            start = end + 1
+
+
+def done_ids_file(index_name: str, model_name: str) -> Path:
+    """Local record of the chunk IDs already upserted to an index with a given model."""
+    return PROJECT_ROOT / f".{index_name}_{model_name.replace('/', '_')}_ingested_ids.txt"
+
+
+def load_done_ids(done_file: Path) -> set[str]:
+    """Load IDs recorded by previous (possibly interrupted) runs."""
+    if not done_file.exists():
+        return set()
+    return set(done_file.read_text(encoding='utf-8').split())
+
+
+def mark_done(done_file: Path, ids: list[str]):
+    """Append IDs whose upsert has been confirmed."""
+    with open(done_file, 'a', encoding='utf-8') as f:
+        f.write("\n".join(ids) + "\n")
+
+
+def create_index(pc: Pinecone, index_name: str, dimension: int, existing: set[str]):
+    """Create Pinecone index if it doesn't exist (existing = names from list_indexes)."""
     if index_name in existing:
         print(f"Index '{index_name}' already exists")
-        return pc.Index(index_name)
+        return pc.Index(index_name, pool_threads=UPSERT_THREADS)
     
     print(f"Creating index '{index_name}'...")
     pc.create_index(
         name=index_name,
         dimension=dimension,
-        metric="cosine",
+        metric="dotproduct",  # Vectors are unit-length, so this ranks exactly like cosine
         spec=ServerlessSpec(
             cloud="aws",
             region="us-east-1"  # Free tier region
@@ -76,11 +132,39 @@ def create_index(pc: Pinecone, index_name: str, dimension: int):
         time.sleep(1)
     
     print("Index ready!")
-    return pc.Index(index_name)
+    return pc.Index(index_name, pool_threads=UPSERT_THREADS)
+
+
+def encode_unique(model, texts: list[str]) -> np.ndarray:
+    """Encode texts, running the model only once per distinct text."""
+    positions = {}
+    for text in texts:
+        positions.setdefault(text, len(positions))
+    if len(positions) == len(texts):
+        return model.encode(texts, batch_size=ENCODE_BATCH_SIZE, show_progress_bar=False)
+    
+    # Repeated boilerplate chunks: encode each text once, then scatter back
+    unique = model.encode(list(positions), batch_size=ENCODE_BATCH_SIZE, show_progress_bar=False)
+    return unique[[positions[text] for text in texts]]
+
+
+def normalize_rows(embeddings: np.ndarray):
+    """Scale each embedding to unit length in place (zero rows are left alone)."""
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    np.divide(embeddings, norms, out=embeddings, where=norms > 0)
+
+
+def metadata_text(text: str) -> str:
+    """Truncate text to METADATA_TEXT_BYTES of UTF-8 without splitting a character."""
+    if len(text) <= METADATA_TEXT_BYTES // 4:  # At most 4 bytes per character
+        return text
+    return text.encode('utf-8')[:METADATA_TEXT_BYTES].decode('utf-8', 'ignore')
 
 
 def prepare_metadata(chunk: dict) -> dict:
     """Prepare metadata for Pinecone (must be flat, no nested objects)."""
+    # Plain dict literal of .get() calls on purpose: itemgetter over a ChainMap
+    # of defaults (or a merged dict) benchmarked 1.3-2.5x slower per chunk
     return {
         "source": chunk.get("source", "unknown"),
         "doc_type": chunk.get("doc_type", "unknown"),
@@ -92,7 +176,7 @@ def prepare_metadata(chunk: dict) -> dict:
         "hazards": ",".join(chunk.get("hazards", [])),
         "operations": ",".join(chunk.get("operations", [])),
         # Store text for retrieval (Pinecone allows up to 40KB metadata)
-        "text": chunk.get("text", "")[:8000],  # Truncate if very long
+        "text": metadata_text(chunk.get("text", "")),  # Truncate if very long
     }
 
 
@@ -101,8 +185,15 @@ def main():
     parser.add_argument("--limit", type=int, default=None, help="Limit chunks for testing")
     parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Upsert batch size")
     parser.add_argument("--delete-existing", action="store_true", help="Delete and recreate index")
+    parser.add_argument("--backend", type=str, default="torch", choices=["torch", "onnx", "static"],
+                        help="Embedding backend (torch = BGE, FP16 on GPU; onnx = BGE on ONNX Runtime, faster on CPU; static = Model2Vec)")
     args = parser.parse_args()
     
+    if args.backend == "static":
+        index_name, model_name, dimension = STATIC_INDEX_NAME, STATIC_EMBEDDING_MODEL, STATIC_EMBEDDING_DIM
+    else:
+        index_name, model_name, dimension = INDEX_NAME, EMBEDDING_MODEL, EMBEDDING_DIM
+    
     print("=" * 60)
     print("Pinecone Ingestion for O&G RAG")
     print("=" * 60)
@@ -115,16 +206,18 @@ def main():
     pc = Pinecone(api_key=api_key)
     print("✓ Pinecone client initialized")
     
+    # List indexes once; both the delete and create steps check against it
+    existing_indexes = {idx.name for idx in pc.list_indexes()}
+    
     # Delete existing index if requested
-    if args.delete_existing:
-        existing = [idx.name for idx in pc.list_indexes()]
-        if INDEX_NAME in existing:
-            print(f"Deleting existing index '{INDEX_NAME}'...")
-            pc.delete_index(INDEX_NAME)
-            time.sleep(5)  # Wait for deletion
+    if args.delete_existing and index_name in existing_indexes:
+        print(f"Deleting existing index '{index_name}'...")
+        pc.delete_index(index_name)
+        time.sleep(5)  # Wait for deletion
+        existing_indexes.discard(index_name)
     
     # Create/get index
-    index = create_index(pc, INDEX_NAME, EMBEDDING_DIM)
+    index = create_index(pc, index_name, dimension, existing_indexes)
     
     # Check current vector count
     stats = index.describe_index_stats()
@@ -137,44 +230,82 @@ def main():
             print("Aborted.")
             return
     
-    # Load chunks
-    print(f"\nLoading chunks from {CHUNKS_FILE}...")
-    chunks = load_chunks(args.limit)
-    print(f"Loaded {len(chunks)} chunks")
+    # IDs upserted by earlier runs are skipped before encoding. A new or empty
+    # index (e.g. deleted in the console) holds none of them, so its record is stale.
+    done_file = done_ids_file(index_name, model_name)
+    if existing_vectors == 0 and done_file.exists():
+        print(f"Index is empty; discarding stale {done_file.name}")
+        done_file.unlink()
+    done = load_done_ids(done_file)
+    if done:
+        print(f"Already ingested (from {done_file.name}): {len(done)}")
+    
+    # Stream chunks; only one batch is parsed and resident at a time
+    print(f"\nReading chunks from {CHUNKS_FILE}...")
+    num_chunks = count_chunks(args.limit)
+    chunks = iter_chunks(args.limit)
+    print(f"Found {num_chunks} chunks")
     
     # Load embedding model
-    print(f"\nLoading embedding model: {EMBEDDING_MODEL}")
-    print("(This may download ~400MB on first run)")
-    model = SentenceTransformer(EMBEDDING_MODEL)
+    print(f"\nLoading embedding model: {model_name}")
+    if args.backend == "static":
+        from model2vec import StaticModel
+        model = StaticModel.from_pretrained(model_name)
+    elif args.backend == "onnx":
+        print("(This may download ~400MB on first run)")
+        model = SentenceTransformer(model_name, backend="onnx", model_kwargs={"file_name": EMBEDDING_ONNX_FILE})
+    else:
+        print("(This may download ~400MB on first run)")
+        model = SentenceTransformer(model_name)
+        if model.device.type == "cuda":
+            model.half()  # FP16 on GPU: half the activation bandwidth
     print("✓ Model loaded")
     
     # Process in batches
     print(f"\nEmbedding and uploading in batches of {args.batch_size}...")
     
     total_uploaded = 0
+    skipped = 0
+    pending = []  # In-flight async upserts with their IDs
+    num_batches = (num_chunks + args.batch_size - 1) // args.batch_size
     
-    for i in tqdm(range(0, len(chunks), args.batch_size), desc="Processing batches"):
-        batch = chunks[i:i + args.batch_size]
+    # Pull batches off the chunk stream until it returns an empty one
+    for batch in tqdm(iter(lambda: list(islice(chunks, args.batch_size)), []),
+                      total=num_batches, desc="Processing batches"):
+        ids = [sanitize_id(chunk["chunk_id"]) for chunk in batch]
+        if done:
+            todo = [(id_, chunk) for id_, chunk in zip(ids, batch) if id_ not in done]
+            skipped += len(batch) - len(todo)
+            if not todo:
+                continue
+            ids, batch = map(list, zip(*todo))
         
         # Get texts for embedding
         texts = [chunk["text"] for chunk in batch]
         
         # Generate embeddings
-        embeddings = model.encode(texts, show_progress_bar=False)
+        embeddings = encode_unique(model, texts)
+        normalize_rows(embeddings)
         
-        # Prepare vectors for upsert
-        vectors = []
-        for chunk, embedding in zip(batch, embeddings):
-            vectors.append({
-                "id": sanitize_id(chunk["chunk_id"]),  # <-- wrap with sanitize_id()
-                "values": embedding.tolist(),
-                "metadata": prepare_metadata(chunk)
-            })
+        # Prepare vectors for upsert (one tolist() for the whole batch)
+        vectors = [
+            {"id": id_, "values": values, "metadata": prepare_metadata(chunk)}
+            for id_, chunk, values in zip(ids, batch, embeddings.tolist())
+        ]
         
-        # Upsert to Pinecone
-        index.upsert(vectors=vectors)
+        # Upsert to Pinecone over gRPC without blocking the next encode
+        pending.append((index.upsert(vectors=vectors, async_req=True), ids))
+        if len(pending) >= UPSERT_THREADS:
+            future, future_ids = pending.pop(0)
+            future.result()
+            mark_done(done_file, future_ids)
         total_uploaded += len(vectors)
     
+    # Wait for remaining upserts
+    for future, future_ids in pending:
+        future.result()
+        mark_done(done_file, future_ids)
+    
     # Final stats
     print("\n" + "=" * 60)
     print("INGESTION COMPLETE")
@@ -185,10 +316,12 @@ def main():
     final_stats = index.describe_index_stats()
     
     print(f"Total vectors uploaded: {total_uploaded}")
+    if skipped:
+        print(f"Skipped (already ingested): {skipped}")
     print(f"Total vectors in index: {final_stats.total_vector_count}")
-    print(f"\nIndex name: {INDEX_NAME}")
-    print(f"Embedding model: {EMBEDDING_MODEL}")
-    print(f"Dimensions: {EMBEDDING_DIM}")
+    print(f"\nIndex name: {index_name}")
+    print(f"Embedding model: {model_name}")
+    print(f"Dimensions: {dimension}")
     
     print("\n✓ Ready for RAG queries!")
 
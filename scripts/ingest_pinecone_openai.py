@@ -4,19 +4,26 @@ Pinecone Ingestion Script - OpenAI Embeddings Version
 Embeds document chunks using OpenAI and uploads to Pinecone.
 
 Requires:
-  pip install pinecone-client openai tqdm
+  pip install pinecone-client openai tqdm orjson numpy tiktoken
 
 Usage:
   python ingest_pinecone_openai.py [--delete-existing]
 """
 
-import json
+import orjson
+import base64
+import numpy as np
+import tiktoken
 import argparse
 from pathlib import Path
+from itertools import islice
+from typing import Iterator
 from tqdm import tqdm
 from pinecone import Pinecone, ServerlessSpec
 from openai import OpenAI
 import time
+from concurrent.futures import ThreadPoolExecutor
+import random
 
 # Paths
 PROJECT_ROOT = Path(__file__).parent.parent
@@ -27,27 +34,168 @@ OPENAI_KEY_FILE = PROJECT_ROOT / ".openai_api_key"
 # Settings
 INDEX_NAME = "og-rag"
 EMBEDDING_MODEL = "text-embedding-3-small"
-EMBEDDING_DIMENSIONS = 1536
+EMBEDDING_DIMENSIONS = 1536  # Shorten (e.g. 512) for a smaller index; match the backend setting
 BATCH_SIZE = 100  # Pinecone upsert batch size
-EMBED_BATCH_SIZE = 100  # OpenAI embedding batch size
+EMBED_BATCH_SIZE = 2048  # OpenAI embedding batch size (per-request input limit)
+MAX_REQUEST_TOKENS = 300_000  # OpenAI's per-request token limit; larger batches are split
+TOKENIZER = tiktoken.get_encoding("cl100k_base")  # text-embedding-3-* tokenizer
+UPSERT_THREADS = 4  # Concurrent async Pinecone upserts
+METADATA_TEXT_BYTES = 8000  # Chunk text kept in metadata, in UTF-8 bytes
+MAX_RETRIES = 6  # OpenAI embeddings and Pinecone upserts
+MAX_BACKOFF = 60  # seconds
 
 
-def load_chunks(filepath: Path) -> list[dict]:
-    """Load chunks from JSONL file."""
-    chunks = []
-    with open(filepath, 'r', encoding='utf-8') as f:
+def metadata_text(text: str) -> str:
+    """Truncate text to METADATA_TEXT_BYTES of UTF-8 without splitting a character."""
+    if len(text) <= METADATA_TEXT_BYTES // 4:  # At most 4 bytes per character
+        return text
+    return text.encode('utf-8')[:METADATA_TEXT_BYTES].decode('utf-8', 'ignore')
+
+
+def iter_chunks(filepath: Path, skip_ids: set[str] = frozenset()) -> Iterator[dict]:
+    """Yield chunks from the JSONL file one at a time, leaving out skip_ids."""
+    with open(filepath, 'rb') as f:
         for line in f:
-            chunks.append(json.loads(line))
-    return chunks
+            chunk = orjson.loads(line)
+            if chunk["chunk_id"] not in skip_ids:
+                yield chunk
+
+
+def done_ids_file(index_name: str, model_name: str) -> Path:
+    """Local record of the chunk IDs already upserted to an index with a given model."""
+    return PROJECT_ROOT / f".{index_name}_{model_name.replace('/', '_')}_ingested_ids.txt"
+
+
+def load_done_ids(done_file: Path) -> set[str]:
+    """Load IDs recorded by previous (possibly interrupted) runs."""
+    if not done_file.exists():
+        return set()
+    return set(done_file.read_text(encoding='utf-8').split())
+
 
+def mark_done(done_file: Path, ids: list[str]):
+    """Append IDs whose upsert has been confirmed."""
+    with open(done_file, 'a', encoding='utf-8') as f:
+        f.write("\n".join(ids) + "\n")
 
-def get_embeddings_batch(texts: list[str], client: OpenAI) -> list[list[float]]:
-    """Get embeddings for a batch of texts from OpenAI."""
-    response = client.embeddings.create(
-        model=EMBEDDING_MODEL,
-        input=texts
-    )
-    return [item.embedding for item in response.data]
+
+def scan_chunks(filepath: Path, skip_ids: set[str] = frozenset()) -> tuple[int, set[int]]:
+    """Count chunks to ingest and collect the hashes of texts that occur more than once."""
+    total = 0
+    seen = set()
+    repeated = set()
+    for chunk in iter_chunks(filepath, skip_ids):
+        total += 1
+        text_hash = hash(chunk["text"])
+        if text_hash in seen:
+            repeated.add(text_hash)
+        else:
+            seen.add(text_hash)
+    return total, repeated
+
+
+class EmbeddingCache:
+    """Embeddings of repeated texts, so each distinct text goes to OpenAI once per run.
+    
+    Only texts whose hash scan_chunks saw more than once are kept, which holds
+    boilerplate (headers, footers, OCR artifacts) rather than the corpus.
+    """
+    
+    def __init__(self, repeated: set[int]):
+        self.repeated = repeated
+        self.rows = {}
+    
+    def missing(self, texts: list[str]) -> list[str]:
+        """Distinct texts in a batch that still need embedding."""
+        return list(dict.fromkeys(text for text in texts if text not in self.rows))
+    
+    def assemble(self, texts: list[str], unique: list[str], embedded: np.ndarray) -> np.ndarray:
+        """Rows for `texts`, from fresh embeddings of `unique` plus cached ones."""
+        for text, row in zip(unique, embedded):
+            if hash(text) in self.repeated:
+                self.rows[text] = row.copy()  # Copy so the batch's buffer can be freed
+        if len(unique) == len(texts):
+            return embedded
+        fresh = dict(zip(unique, embedded))
+        return np.stack([fresh[text] if text in fresh else self.rows[text] for text in texts])
+
+
+def decode_embeddings(response) -> np.ndarray:
+    """Unpack base64 float32 embeddings into a single array (no per-float Python objects)."""
+    packed = b''.join(base64.b64decode(item.embedding) for item in response.data)
+    return np.frombuffer(packed, dtype=np.float32).reshape(-1, EMBEDDING_DIMENSIONS)
+
+
+def retry_delay(attempt: int, error: Exception) -> float:
+    """Seconds to wait before retry `attempt`.
+    
+    Honors a Retry-After header on the failed response (OpenAI errors carry it
+    on .response, Pinecone errors on .headers); otherwise full-jitter
+    exponential backoff, so concurrent retries don't land in lockstep.
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None) or getattr(error, "headers", None) or {}
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        try:
+            return min(float(retry_after), MAX_BACKOFF)
+        except ValueError:
+            pass  # HTTP-date form; fall back to backoff
+    return random.uniform(0, min(MAX_BACKOFF, 2 ** attempt))
+
+
+def wait_upsert(index, result, vectors: list[dict], done_file: Path):
+    """Wait for an async upsert, re-sending the batch after a backoff if it failed.
+    
+    Confirmed IDs are recorded in done_file so a rerun can skip them.
+    """
+    for attempt in range(MAX_RETRIES):
+        try:
+            result.get()
+            mark_done(done_file, [vector["id"] for vector in vectors])
+            return
+        except Exception as e:
+            if attempt == MAX_RETRIES - 1:
+                raise
+            time.sleep(retry_delay(attempt, e))
+            result = index.upsert(vectors=vectors, async_req=True)
+
+
+def token_lengths(texts: list[str]) -> list[int]:
+    """Token count of each text, as OpenAI will bill it."""
+    return [len(tokens) for tokens in TOKENIZER.encode_ordinary_batch(texts, num_threads=8)]
+
+
+def split_by_tokens(texts: list[str], token_counts: list[int], max_tokens: int) -> Iterator[tuple[list[str], int]]:
+    """Split a batch into consecutive sub-batches of at most max_tokens each.
+    
+    Yields (texts, total_tokens) pairs.
+    """
+    start = total = 0
+    for i, n in enumerate(token_counts):
+        if total + n > max_tokens and i > start:
+            yield texts[start:i], total
+            start, total = i, 0
+        total += n
+    yield texts[start:], total
+
+
+def get_embeddings_batch(texts: list[str], client: OpenAI) -> np.ndarray:
+    """Get embeddings for a batch of texts from OpenAI as one (n, dims) float32 array.
+    
+    Batches over the per-request token limit are sent as several requests.
+    """
+    if not texts:
+        return np.empty((0, EMBEDDING_DIMENSIONS), dtype=np.float32)
+    parts = []
+    for part, _ in split_by_tokens(texts, token_lengths(texts), MAX_REQUEST_TOKENS):
+        response = client.embeddings.create(
+            model=EMBEDDING_MODEL,
+            input=part,
+            dimensions=EMBEDDING_DIMENSIONS,
+            encoding_format="base64"
+        )
+        parts.append(decode_embeddings(response))
+    return parts[0] if len(parts) == 1 else np.concatenate(parts)
 
 
 def main():
@@ -77,7 +225,14 @@ def main():
     openai_client = OpenAI(api_key=openai_key)
     print("✓ Clients initialized")
 
+    # Load chunks
+    if not CHUNKS_FILE.exists():
+        print(f"ERROR: Chunks file not found: {CHUNKS_FILE}")
+        print("Run chunk_documents.py first.")
+        return
+
     # Handle index
+    done_file = done_ids_file(INDEX_NAME, EMBEDDING_MODEL)
     existing_indexes = [idx.name for idx in pc.list_indexes()]
 
     if args.delete_existing and INDEX_NAME in existing_indexes:
@@ -86,66 +241,89 @@ def main():
         time.sleep(5)  # Wait for deletion
         existing_indexes = []
 
+    # A record kept for an index that no longer exists (deleted here or in the
+    # console) is stale: the index about to be created holds none of its IDs
     if INDEX_NAME not in existing_indexes:
-        print(f"Creating index '{INDEX_NAME}'...")
-        pc.create_index(
-            name=INDEX_NAME,
-            dimension=EMBEDDING_DIMENSIONS,
-            metric="cosine",
-            spec=ServerlessSpec(cloud="aws", region="us-east-1")
-        )
-        print("Waiting for index to be ready...")
-        while not pc.describe_index(INDEX_NAME).status.ready:
-            time.sleep(2)
-        print("Index ready!")
+        done_file.unlink(missing_ok=True)
 
-    index = pc.Index(INDEX_NAME)
-    stats = index.describe_index_stats()
-    print(f"Current vectors in index: {stats.total_vector_count}")
+    # IDs upserted by earlier runs are skipped before embedding
+    done = load_done_ids(done_file)
+    if done:
+        print(f"Already ingested (from {done_file.name}): {len(done):,}")
 
-    # Load chunks
-    if not CHUNKS_FILE.exists():
-        print(f"ERROR: Chunks file not found: {CHUNKS_FILE}")
-        print("Run chunk_documents.py first.")
-        return
+    # Scan the chunks file in the background while the index is created and comes up
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        scan_future = executor.submit(scan_chunks, CHUNKS_FILE, done)
+
+        if INDEX_NAME not in existing_indexes:
+            print(f"Creating index '{INDEX_NAME}'...")
+            pc.create_index(
+                name=INDEX_NAME,
+                dimension=EMBEDDING_DIMENSIONS,
+                metric="cosine",
+                spec=ServerlessSpec(cloud="aws", region="us-east-1")
+            )
+            print("Waiting for index to be ready...")
+            while not pc.describe_index(INDEX_NAME).status.ready:
+                time.sleep(2)
+            print("Index ready!")
+
+        # Size the connection pool to the thread pool so no upsert thread has to
+        # open (and then discard) a fresh TLS connection
+        index = pc.Index(INDEX_NAME, pool_threads=UPSERT_THREADS, connection_pool_maxsize=UPSERT_THREADS)
+        stats = index.describe_index_stats()
+        print(f"Current vectors in index: {stats.total_vector_count}")
+
+        total_chunks, repeated = scan_future.result()
 
-    print(f"Loading chunks from {CHUNKS_FILE}...")
-    chunks = load_chunks(CHUNKS_FILE)
-    print(f"Loaded {len(chunks):,} chunks")
+    # Likewise for an index that exists but is empty; rescan without the record
+    if done and stats.total_vector_count == 0:
+        print(f"Index is empty; discarding stale {done_file.name}")
+        done_file.unlink()
+        done = set()
+        total_chunks, repeated = scan_chunks(CHUNKS_FILE, done)
+
+    print(f"Streaming {total_chunks:,} chunks from {CHUNKS_FILE}")
+    print(f"{len(repeated):,} texts repeat; each is embedded once")
+    cache = EmbeddingCache(repeated)
 
     # Process in batches
-    print(f"\nEmbedding and uploading in batches of {BATCH_SIZE}...")
+    print(f"\nEmbedding in batches of {EMBED_BATCH_SIZE}, uploading in batches of {BATCH_SIZE}...")
     print(f"Using OpenAI model: {EMBEDDING_MODEL}")
     
     total_uploaded = 0
+    pending = []  # In-flight async upserts
     
-    for i in tqdm(range(0, len(chunks), BATCH_SIZE), desc="Processing batches"):
-        batch_chunks = chunks[i:i + BATCH_SIZE]
-        
+    chunk_iter = iter_chunks(CHUNKS_FILE, done)
+    pbar = tqdm(total=total_chunks, desc="Processing chunks", unit="chunks")
+    
+    while batch_chunks := list(islice(chunk_iter, EMBED_BATCH_SIZE)):
         # Get texts for embedding
         texts = [c["text"] for c in batch_chunks]
         
-        # Get embeddings from OpenAI (with retry logic)
-        max_retries = 3
-        for attempt in range(max_retries):
+        # Get embeddings from OpenAI for texts not seen yet (with retry logic)
+        unique = cache.missing(texts)
+        for attempt in range(MAX_RETRIES):
             try:
-                embeddings = get_embeddings_batch(texts, openai_client)
+                fresh = get_embeddings_batch(unique, openai_client)
                 break
             except Exception as e:
-                if attempt < max_retries - 1:
-                    print(f"\nRetrying batch due to: {e}")
-                    time.sleep(2 ** attempt)  # Exponential backoff
+                if attempt < MAX_RETRIES - 1:
+                    wait_time = retry_delay(attempt, e)
+                    print(f"\nRetrying batch in {wait_time:.1f}s due to: {e}")
+                    time.sleep(wait_time)
                 else:
                     raise
+        embeddings = cache.assemble(texts, unique, fresh)
         
         # Prepare vectors for Pinecone
         vectors = []
-        for chunk, embedding in zip(batch_chunks, embeddings):
+        for chunk, embedding in zip(batch_chunks, embeddings.tolist()):
             vectors.append({
                 "id": chunk["chunk_id"],
                 "values": embedding,
                 "metadata": {
-                    "text": chunk["text"][:8000],  # Pinecone metadata limit
+                    "text": metadata_text(chunk["text"]),  # Pinecone metadata limit
                     "source": chunk.get("source", "unknown"),
                     "doc_type": chunk.get("doc_type", "unknown"),
                     "source_file": chunk.get("source_file", ""),
@@ -153,12 +331,20 @@ def main():
                 }
             })
         
-        # Upsert to Pinecone
-        index.upsert(vectors=vectors)
+        # Upsert to Pinecone without blocking the next embedding call
+        for i in range(0, len(vectors), BATCH_SIZE):
+            batch_vectors = vectors[i:i + BATCH_SIZE]
+            pending.append((index.upsert(vectors=batch_vectors, async_req=True), batch_vectors))
+            if len(pending) >= UPSERT_THREADS:
+                wait_upsert(index, *pending.pop(0), done_file)
         total_uploaded += len(vectors)
-        
-        # Small delay to avoid rate limits
-        time.sleep(0.1)
+        pbar.update(len(vectors))
+
+    pbar.close()
+
+    # Wait for remaining upserts
+    for result, vectors in pending:
+        wait_upsert(index, result, vectors, done_file)
 
     # Final stats
     stats = index.describe_index_stats()
@@ -1,24 +1,31 @@
 #!/usr/bin/env python3
 """
 Pinecone Ingestion Script - OpenAI Embeddings (Parallel Version)
-Embeds document chunks using OpenAI with concurrent requests.
+Embeds document chunks using OpenAI with concurrent requests (asyncio).
 
 Requires:
-  pip install pinecone openai tqdm
+  pip install pinecone openai "httpx[http2]" tqdm orjson numpy tiktoken
 
 Usage:
   python ingest_pinecone_openai_parallel.py [--delete-existing]
 """
 
-import json
+import orjson
+import base64
+import numpy as np
+import tiktoken
 import argparse
 from pathlib import Path
+from itertools import islice
+from typing import Iterator
 from tqdm import tqdm
 from pinecone import Pinecone, ServerlessSpec
-from openai import OpenAI
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, RateLimitError
+import httpx
+import asyncio
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import threading
+from concurrent.futures import ThreadPoolExecutor
+import random
 
 # Paths
 PROJECT_ROOT = Path(__file__).parent.parent
@@ -29,95 +36,348 @@ OPENAI_KEY_FILE = PROJECT_ROOT / ".openai_api_key"
 # Settings
 INDEX_NAME = "og-rag"
 EMBEDDING_MODEL = "text-embedding-3-small"
-EMBEDDING_DIMENSIONS = 1536
+EMBEDDING_DIMENSIONS = 1536  # Shorten (e.g. 512) for a smaller index; match the backend setting
 
 # Batch sizes
-OPENAI_BATCH_SIZE = 1000  # OpenAI allows up to 2048 per request
+OPENAI_BATCH_SIZE = 2048  # OpenAI's per-request input limit
+MAX_REQUEST_TOKENS = 300_000  # OpenAI's per-request token limit; larger batches are split
 PINECONE_BATCH_SIZE = 100  # Pinecone upsert batch size
 MAX_WORKERS = 5  # Concurrent OpenAI requests
+UPSERT_WORKERS = 2  # Concurrent Pinecone upload batches
+UPSERT_THREADS = 30  # Pinecone client pool for async upserts
+METADATA_TEXT_BYTES = 8000  # Chunk text kept in metadata, in UTF-8 bytes
 
-# Thread-safe counter
-upload_lock = threading.Lock()
-total_uploaded = 0
+# OpenAI embedding rate limits per usage tier: (requests/min, tokens/min).
+# Check your organization's limits page; --tier picks the row.
+RATE_LIMITS = {
+    "free": (100, 40_000),
+    "1": (3_000, 1_000_000),
+    "2": (5_000, 1_000_000),
+    "3": (5_000, 5_000_000),
+    "4": (10_000, 5_000_000),
+    "5": (10_000, 10_000_000),
+}
+DEFAULT_TIER = "1"
+TOKENIZER = tiktoken.get_encoding("cl100k_base")  # text-embedding-3-* tokenizer
 
+# Retries (OpenAI embeddings and Pinecone upserts)
+MAX_RETRIES = 6
+MAX_BACKOFF = 60  # seconds
 
-def load_chunks(filepath: Path) -> list[dict]:
-    """Load chunks from JSONL file."""
-    chunks = []
-    with open(filepath, 'r', encoding='utf-8') as f:
+
+class RateLimiter:
+    """Async token bucket refilling `per_minute` units a minute, bursting to one minute's worth."""
+    
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+    
+    async def acquire(self, amount: float = 1):
+        """Wait until `amount` units (at most one minute's worth) are available, then take them."""
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.level >= amount:
+                    self.level -= amount
+                    return
+                await asyncio.sleep((amount - self.level) / self.rate)
+
+
+def token_lengths(texts: list[str]) -> list[int]:
+    """Token count of each text, as OpenAI will bill it."""
+    return [len(tokens) for tokens in TOKENIZER.encode_ordinary_batch(texts, num_threads=8)]
+
+
+def split_by_tokens(texts: list[str], token_counts: list[int], max_tokens: int) -> Iterator[tuple[list[str], int]]:
+    """Split a batch into consecutive sub-batches of at most max_tokens each.
+    
+    Yields (texts, total_tokens) pairs.
+    """
+    start = total = 0
+    for i, n in enumerate(token_counts):
+        if total + n > max_tokens and i > start:
+            yield texts[start:i], total
+            start, total = i, 0
+        total += n
+    yield texts[start:], total
+
+
+def metadata_text(text: str) -> str:
+    """Truncate text to METADATA_TEXT_BYTES of UTF-8 without splitting a character."""
+    if len(text) <= METADATA_TEXT_BYTES // 4:  # At most 4 bytes per character
+        return text
+    return text.encode('utf-8')[:METADATA_TEXT_BYTES].decode('utf-8', 'ignore')
+
+
+def iter_chunks(filepath: Path, skip_ids: set[str] = frozenset()) -> Iterator[dict]:
+    """Yield chunks from the JSONL file one at a time, leaving out skip_ids."""
+    with open(filepath, 'rb') as f:
         for line in f:
-            chunks.append(json.loads(line))
-    return chunks
+            chunk = orjson.loads(line)
+            if chunk["chunk_id"] not in skip_ids:
+                yield chunk
+
+
+def done_ids_file(index_name: str, model_name: str) -> Path:
+    """Local record of the chunk IDs already upserted to an index with a given model."""
+    return PROJECT_ROOT / f".{index_name}_{model_name.replace('/', '_')}_ingested_ids.txt"
+
+
+def load_done_ids(done_file: Path) -> set[str]:
+    """Load IDs recorded by previous (possibly interrupted) runs."""
+    if not done_file.exists():
+        return set()
+    return set(done_file.read_text(encoding='utf-8').split())
+
+
+def mark_done(done_file: Path, ids: list[str]):
+    """Append IDs whose upsert has been confirmed."""
+    with open(done_file, 'a', encoding='utf-8') as f:
+        f.write("\n".join(ids) + "\n")
+
 
+def scan_chunks(filepath: Path, skip_ids: set[str] = frozenset()) -> tuple[int, set[int]]:
+    """Count chunks to ingest and collect the hashes of texts that occur more than once."""
+    total = 0
+    seen = set()
+    repeated = set()
+    for chunk in iter_chunks(filepath, skip_ids):
+        total += 1
+        text_hash = hash(chunk["text"])
+        if text_hash in seen:
+            repeated.add(text_hash)
+        else:
+            seen.add(text_hash)
+    return total, repeated
 
-def get_embeddings_batch(texts: list[str], client: OpenAI) -> list[list[float]]:
-    """Get embeddings for a batch of texts from OpenAI."""
-    max_retries = 5
-    for attempt in range(max_retries):
+
+class EmbeddingCache:
+    """Embeddings of repeated texts, so each distinct text goes to OpenAI once per run.
+    
+    Only texts whose hash scan_chunks saw more than once are kept, which holds
+    boilerplate (headers, footers, OCR artifacts) rather than the corpus.
+    """
+    
+    def __init__(self, repeated: set[int]):
+        self.repeated = repeated
+        self.rows = {}
+    
+    def missing(self, texts: list[str]) -> list[str]:
+        """Distinct texts in a batch that still need embedding."""
+        return list(dict.fromkeys(text for text in texts if text not in self.rows))
+    
+    def assemble(self, texts: list[str], unique: list[str], embedded: np.ndarray) -> np.ndarray:
+        """Rows for `texts`, from fresh embeddings of `unique` plus cached ones."""
+        for text, row in zip(unique, embedded):
+            if hash(text) in self.repeated:
+                self.rows[text] = row.copy()  # Copy so the batch's buffer can be freed
+        if len(unique) == len(texts):
+            return embedded
+        fresh = dict(zip(unique, embedded))
+        return np.stack([fresh[text] if text in fresh else self.rows[text] for text in texts])
+
+
+def decode_embeddings(response) -> np.ndarray:
+    """Unpack base64 float32 embeddings into a single array (no per-float Python objects)."""
+    packed = b''.join(base64.b64decode(item.embedding) for item in response.data)
+    return np.frombuffer(packed, dtype=np.float32).reshape(-1, EMBEDDING_DIMENSIONS)
+
+
+def retry_delay(attempt: int, error: Exception) -> float:
+    """Seconds to wait before retry `attempt`.
+    
+    Honors a Retry-After header on the failed response (OpenAI errors carry it
+    on .response, Pinecone errors on .headers); otherwise full-jitter
+    exponential backoff, so concurrent retries don't land in lockstep.
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None) or getattr(error, "headers", None) or {}
+    retry_after = headers.get("retry-after")
+    if retry_after:
         try:
-            response = client.embeddings.create(
+            return min(float(retry_after), MAX_BACKOFF)
+        except ValueError:
+            pass  # HTTP-date form; fall back to backoff
+    return random.uniform(0, min(MAX_BACKOFF, 2 ** attempt))
+
+
+async def get_embeddings_batch(texts: list[str], client: AsyncOpenAI,
+                               rpm: RateLimiter, tpm: RateLimiter, tokens: int) -> np.ndarray:
+    """Get embeddings for one OpenAI request as a (n, dims) float32 array.
+    
+    Each attempt waits for request and token budget first, so the tier's
+    limits are respected up front instead of discovered through 429s.
+    """
+    for attempt in range(MAX_RETRIES):
+        try:
+            await rpm.acquire()
+            await tpm.acquire(tokens)
+            response = await client.embeddings.create(
                 model=EMBEDDING_MODEL,
-                input=texts
+                input=texts,
+                dimensions=EMBEDDING_DIMENSIONS,
+                encoding_format="base64"
             )
-            return [item.embedding for item in response.data]
+            return decode_embeddings(response)
         except Exception as e:
-            if "rate_limit" in str(e).lower() or "429" in str(e):
-                wait_time = 2 ** attempt
-                print(f"\nRate limited, waiting {wait_time}s...")
-                time.sleep(wait_time)
-            elif attempt < max_retries - 1:
-                print(f"\nRetrying due to: {e}")
-                time.sleep(1)
-            else:
+            if attempt == MAX_RETRIES - 1:
                 raise
-    return []
+            wait_time = retry_delay(attempt, e)
+            if isinstance(e, RateLimitError):
+                print(f"\nRate limited, waiting {wait_time:.1f}s...")
+            else:
+                print(f"\nRetrying in {wait_time:.1f}s due to: {e}")
+            await asyncio.sleep(wait_time)
+
+
+async def embed_texts(texts: list[str], client: AsyncOpenAI,
+                      rpm: RateLimiter, tpm: RateLimiter) -> np.ndarray:
+    """Embed a batch, split into as few requests as the per-request token limit allows.
+    
+    No request may exceed the tier's tokens per minute either (40k on the free
+    tier), since OpenAI would reject it however long we waited.
+    """
+    if not texts:
+        return np.empty((0, EMBEDDING_DIMENSIONS), dtype=np.float32)
+    token_counts = await asyncio.to_thread(token_lengths, texts)
+    parts = [
+        await get_embeddings_batch(part, client, rpm, tpm, tokens)
+        for part, tokens in split_by_tokens(texts, token_counts, min(MAX_REQUEST_TOKENS, tpm.capacity))
+    ]
+    return parts[0] if len(parts) == 1 else np.concatenate(parts)
 
 
-def process_batch(batch_data: tuple, openai_client: OpenAI, index) -> int:
-    """Process a single batch: embed and upload to Pinecone."""
-    global total_uploaded
-    batch_idx, batch_chunks = batch_data
+def chunks(iterable, batch_size: int):
+    """Yield successive lists of batch_size items from iterable."""
+    it = iter(iterable)
+    batch = list(islice(it, batch_size))
+    while batch:
+        yield batch
+        batch = list(islice(it, batch_size))
+
+
+def upsert_vectors(index, vectors: list[dict]):
+    """Upload vectors to Pinecone in smaller batches, fired together on the index's pool.
     
-    # Get texts and embeddings
-    texts = [c["text"] for c in batch_chunks]
-    embeddings = get_embeddings_batch(texts, openai_client)
+    On failure the whole set is re-sent after a backoff (upserts are idempotent).
+    """
+    for attempt in range(MAX_RETRIES):
+        try:
+            async_results = [
+                index.upsert(vectors=pinecone_batch, async_req=True)
+                for pinecone_batch in chunks(vectors, PINECONE_BATCH_SIZE)
+            ]
+            for result in async_results:
+                result.get()
+            return
+        except Exception as e:
+            if attempt == MAX_RETRIES - 1:
+                raise
+            time.sleep(retry_delay(attempt, e))
+
+
+async def embed_worker(batches: Iterator[tuple], openai_client: AsyncOpenAI, queue: asyncio.Queue,
+                       rpm: RateLimiter, tpm: RateLimiter, cache: EmbeddingCache):
+    """Producer: embed batches pulled from the shared stream and queue them for upload."""
+    for batch_idx, batch_chunks in batches:
+        texts = [c["text"] for c in batch_chunks]
+        unique = cache.missing(texts)
+        try:
+            fresh = await embed_texts(unique, openai_client, rpm, tpm)
+        except Exception as e:
+            print(f"\nBatch {batch_idx} failed to embed: {e}")
+            continue
+        
+        await queue.put((batch_idx, batch_chunks, cache.assemble(texts, unique, fresh)))
+
+
+async def upsert_worker(queue: asyncio.Queue, index, pbar: tqdm, done_file: Path) -> int:
+    """Consumer: upload embedded batches to Pinecone until a None sentinel arrives.
     
-    if not embeddings:
-        return 0
+    Confirmed IDs are recorded in done_file so a rerun can skip them.
+    Returns the number of vectors this worker uploaded.
+    """
+    uploaded = 0
+    while (item := await queue.get()) is not None:
+        batch_idx, batch_chunks, embeddings = item
+        
+        # Prepare vectors
+        vectors = []
+        for chunk, embedding in zip(batch_chunks, embeddings.tolist()):
+            vectors.append({
+                "id": chunk["chunk_id"],
+                "values": embedding,
+                "metadata": {
+                    "text": metadata_text(chunk["text"]),
+                    "source": chunk.get("source", "unknown"),
+                    "doc_type": chunk.get("doc_type", "unknown"),
+                    "source_file": chunk.get("source_file", ""),
+                    "doc_id": chunk.get("doc_id", ""),
+                }
+            })
+        
+        # Upload to Pinecone off the event loop (the Pinecone client is synchronous)
+        try:
+            await asyncio.to_thread(upsert_vectors, index, vectors)
+        except Exception as e:
+            print(f"\nBatch {batch_idx} failed to upload: {e}")
+            continue
+        
+        mark_done(done_file, [vector["id"] for vector in vectors])
+        uploaded += len(vectors)
+        pbar.update(len(vectors))
     
-    # Prepare vectors
-    vectors = []
-    for chunk, embedding in zip(batch_chunks, embeddings):
-        vectors.append({
-            "id": chunk["chunk_id"],
-            "values": embedding,
-            "metadata": {
-                "text": chunk["text"][:8000],
-                "source": chunk.get("source", "unknown"),
-                "doc_type": chunk.get("doc_type", "unknown"),
-                "source_file": chunk.get("source_file", ""),
-                "doc_id": chunk.get("doc_id", ""),
-            }
-        })
+    return uploaded
+
+
+async def process_all(batches: Iterator[tuple], openai_key: str, index,
+                      embed_workers: int, upsert_workers: int, tier: str, total: int,
+                      repeated: set[int], done_file: Path) -> int:
+    """Embed and upload as a two-stage pipeline joined by a bounded queue.
     
-    # Upload to Pinecone in smaller batches
-    for i in range(0, len(vectors), PINECONE_BATCH_SIZE):
-        pinecone_batch = vectors[i:i + PINECONE_BATCH_SIZE]
-        index.upsert(vectors=pinecone_batch)
+    `embed_workers` OpenAI requests and `upsert_workers` Pinecone uploads run
+    at once, so both services stay busy. Batches are pulled from the stream
+    only when an embed worker is free, and the queue holds at most
+    2 * embed_workers embedded batches. OpenAI requests are throttled to the
+    `tier` rate limits, and `repeated` texts are embedded only once.
+    Returns the number of vectors uploaded.
+    """
+    # HTTP/2: concurrent embedding requests multiplex over one warm TLS connection
+    openai_client = AsyncOpenAI(
+        api_key=openai_key,
+        http_client=DefaultAsyncHttpxClient(
+            http2=True,
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=64),
+        ),
+    )
+    requests_per_min, tokens_per_min = RATE_LIMITS[tier]
+    rpm = RateLimiter(requests_per_min)
+    tpm = RateLimiter(tokens_per_min)
+    cache = EmbeddingCache(repeated)
+    queue = asyncio.Queue(maxsize=2 * embed_workers)
     
-    with upload_lock:
-        total_uploaded += len(vectors)
+    with tqdm(total=total, desc="Embedding & uploading", unit="chunks") as pbar:
+        uploaders = [asyncio.create_task(upsert_worker(queue, index, pbar, done_file)) for _ in range(upsert_workers)]
+        await asyncio.gather(*(embed_worker(batches, openai_client, queue, rpm, tpm, cache) for _ in range(embed_workers)))
+        for _ in uploaders:
+            await queue.put(None)
+        uploaded = sum(await asyncio.gather(*uploaders))
     
-    return len(vectors)
+    await openai_client.close()
+    return uploaded
 
 
 def main():
-    global total_uploaded
-    
     parser = argparse.ArgumentParser(description="Ingest chunks into Pinecone with OpenAI embeddings (parallel)")
     parser.add_argument("--delete-existing", action="store_true", help="Delete existing index first")
-    parser.add_argument("--workers", type=int, default=MAX_WORKERS, help=f"Number of concurrent workers (default: {MAX_WORKERS})")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS, help=f"Number of concurrent OpenAI requests (default: {MAX_WORKERS})")
+    parser.add_argument("--upsert-workers", type=int, default=UPSERT_WORKERS, help=f"Number of concurrent Pinecone upload batches (default: {UPSERT_WORKERS})")
     parser.add_argument("--batch-size", type=int, default=OPENAI_BATCH_SIZE, help=f"OpenAI batch size (default: {OPENAI_BATCH_SIZE})")
+    parser.add_argument("--tier", choices=list(RATE_LIMITS), default=DEFAULT_TIER, help=f"OpenAI usage tier for client-side rate limiting (default: {DEFAULT_TIER})")
     args = parser.parse_args()
 
     print("=" * 60)
@@ -136,71 +396,81 @@ def main():
     openai_key = OPENAI_KEY_FILE.read_text().strip()
     print("✓ API keys loaded")
 
-    # Initialize clients
+    # Initialize clients (the async OpenAI client is created inside the event loop)
     pc = Pinecone(api_key=pinecone_key)
-    openai_client = OpenAI(api_key=openai_key)
     print("✓ Clients initialized")
 
+    # Load chunks
+    if not CHUNKS_FILE.exists():
+        print(f"ERROR: Chunks file not found: {CHUNKS_FILE}")
+        return
+
     # Handle index
+    done_file = done_ids_file(INDEX_NAME, EMBEDDING_MODEL)
     existing_indexes = [idx.name for idx in pc.list_indexes()]
 
     if args.delete_existing and INDEX_NAME in existing_indexes:
         print(f"Deleting existing index '{INDEX_NAME}'...")
         pc.delete_index(INDEX_NAME)
-        time.sleep(5)
+        time.sleep(5)  # Wait for deletion
         existing_indexes = []
 
+    # A record kept for an index that no longer exists (deleted here or in the
+    # console) is stale: the index about to be created holds none of its IDs
     if INDEX_NAME not in existing_indexes:
-        print(f"Creating index '{INDEX_NAME}'...")
-        pc.create_index(
-            name=INDEX_NAME,
-            dimension=EMBEDDING_DIMENSIONS,
-            metric="cosine",
-            spec=ServerlessSpec(cloud="aws", region="us-east-1")
-        )
-        print("Waiting for index to be ready...")
-        while not pc.describe_index(INDEX_NAME).status.ready:
-            time.sleep(2)
-        print("Index ready!")
-
-    index = pc.Index(INDEX_NAME)
-    stats = index.describe_index_stats()
-    print(f"Current vectors in index: {stats.total_vector_count}")
+        done_file.unlink(missing_ok=True)
 
-    # Load chunks
-    if not CHUNKS_FILE.exists():
-        print(f"ERROR: Chunks file not found: {CHUNKS_FILE}")
-        return
+    # IDs upserted by earlier runs are skipped before embedding
+    done = load_done_ids(done_file)
+    if done:
+        print(f"Already ingested (from {done_file.name}): {len(done):,}")
+
+    # Scan the chunks file in the background while the index is created and comes up
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        scan_future = executor.submit(scan_chunks, CHUNKS_FILE, done)
+
+        if INDEX_NAME not in existing_indexes:
+            print(f"Creating index '{INDEX_NAME}'...")
+            pc.create_index(
+                name=INDEX_NAME,
+                dimension=EMBEDDING_DIMENSIONS,
+                metric="cosine",
+                spec=ServerlessSpec(cloud="aws", region="us-east-1")
+            )
+            print("Waiting for index to be ready...")
+            while not pc.describe_index(INDEX_NAME).status.ready:
+                time.sleep(2)
+            print("Index ready!")
+
+        # Size the connection pool to the thread pool so no upsert thread has to
+        # open (and then discard) a fresh TLS connection
+        index = pc.Index(INDEX_NAME, pool_threads=UPSERT_THREADS, connection_pool_maxsize=UPSERT_THREADS)
+        stats = index.describe_index_stats()
+        print(f"Current vectors in index: {stats.total_vector_count}")
 
-    print(f"Loading chunks from {CHUNKS_FILE}...")
-    chunks = load_chunks(CHUNKS_FILE)
-    print(f"Loaded {len(chunks):,} chunks")
+        total_chunks, repeated = scan_future.result()
 
-    # Create batches
-    batches = []
-    for i in range(0, len(chunks), args.batch_size):
-        batches.append((i // args.batch_size, chunks[i:i + args.batch_size]))
+    # Likewise for an index that exists but is empty; rescan without the record
+    if done and stats.total_vector_count == 0:
+        print(f"Index is empty; discarding stale {done_file.name}")
+        done_file.unlink()
+        done = set()
+        total_chunks, repeated = scan_chunks(CHUNKS_FILE, done)
+
+    print(f"Streaming {total_chunks:,} chunks from {CHUNKS_FILE}")
+    print(f"{len(repeated):,} texts repeat; each is embedded once")
+
+    # Batches are read lazily from the file as the workers need them
+    batches = enumerate(chunks(iter_chunks(CHUNKS_FILE, done), args.batch_size))
     
-    print(f"\nProcessing {len(batches)} batches with {args.workers} workers...")
+    print(f"\nProcessing {-(-total_chunks // args.batch_size)} batches with {args.workers} workers...")
     print(f"OpenAI batch size: {args.batch_size}")
+    print(f"Rate limits (tier {args.tier}): {RATE_LIMITS[args.tier][0]:,} RPM, {RATE_LIMITS[args.tier][1]:,} TPM")
     print(f"Embedding model: {EMBEDDING_MODEL}")
 
-    # Process in parallel
+    # Process concurrently
     start_time = time.time()
-    
-    with ThreadPoolExecutor(max_workers=args.workers) as executor:
-        futures = {
-            executor.submit(process_batch, batch, openai_client, index): batch[0] 
-            for batch in batches
-        }
-        
-        with tqdm(total=len(chunks), desc="Embedding & uploading") as pbar:
-            for future in as_completed(futures):
-                try:
-                    count = future.result()
-                    pbar.update(count)
-                except Exception as e:
-                    print(f"\nBatch failed: {e}")
+    total_uploaded = asyncio.run(process_all(batches, openai_key, index, args.workers, args.upsert_workers, args.tier, total_chunks, repeated, done_file))
 
     elapsed = time.time() - start_time
     
@@ -4,21 +4,19 @@ O&G RAG Assistant - Query Interface
 Retrieves relevant chunks from Pinecone and generates answers with Claude
 """
 import os
-os.environ['TF_ENABLE_ONEDNN_OPTS'] = '0'
-os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+os.environ.setdefault('USE_TF', '0')  # Keep transformers from importing TensorFlow if it's installed
 
-import tensorflow as tf
-tf.get_logger().setLevel("ERROR")
 from pathlib import Path
-from pinecone import Pinecone
+from pinecone.grpc import PineconeGRPC as Pinecone  # pip install "pinecone[grpc]"
 from sentence_transformers import SentenceTransformer
 import anthropic
 import argparse
 import textwrap
+from concurrent.futures import ThreadPoolExecutor
+from itertools import takewhile
+from functools import lru_cache
 
 
-os.environ['TF_ENABLE_ONEDNN_OPTS'] = '0'
-os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
 # Paths
 PROJECT_ROOT = Path(__file__).parent.parent
 PINECONE_KEY_FILE = PROJECT_ROOT / ".pinecone_api_key"
@@ -27,6 +25,11 @@ ANTHROPIC_KEY_FILE = PROJECT_ROOT / ".anthropic_api_key"
 # Settings
 INDEX_NAME = "og-rag"
 EMBEDDING_MODEL = "BAAI/bge-base-en-v1.5"
+# Dynamic INT8 export for AVX-512 VNNI CPUs (pip install sentence-transformers[onnx])
+EMBEDDING_ONNX_FILE = "onnx/model_qint8_avx512_vnni.onnx"
+# Model2Vec static embeddings (pip install model2vec) - needs its own index
+STATIC_EMBEDDING_MODEL = "minishlab/potion-base-8M"
+STATIC_INDEX_NAME = "og-rag-static"
 CLAUDE_MODEL = "claude-sonnet-4-20250514"  # Best quality/cost ratio
 MAX_TOKENS = 1024
 
@@ -48,6 +51,9 @@ When answering questions:
 
 If asked about something outside the O&G domain or not covered in the context, acknowledge the limitation."""
 
+# System prompt as a cacheable block so Claude can reuse the prefix across queries
+SYSTEM_BLOCKS = [{"type": "text", "text": SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}}]
+
 
 def load_keys() -> tuple[str, str]:
     """Load API keys from files."""
@@ -56,10 +62,44 @@ def load_keys() -> tuple[str, str]:
     return pinecone_key, anthropic_key
 
 
+def load_embedding_model(backend: str = "onnx", precision: str = "fp32"):
+    """Load the query embedding model (ONNX INT8 on CPU by default).
+    
+    `precision` applies to the torch backend: fp16 halves the model on GPU,
+    int8 dynamically quantizes its Linear layers on CPU.
+    """
+    if backend == "static":
+        from model2vec import StaticModel
+        return StaticModel.from_pretrained(STATIC_EMBEDDING_MODEL)
+    if backend == "onnx":
+        return SentenceTransformer(
+            EMBEDDING_MODEL,
+            backend="onnx",
+            model_kwargs={"file_name": EMBEDDING_ONNX_FILE},
+        )
+    if precision == "int8":
+        import torch
+        model = SentenceTransformer(EMBEDDING_MODEL, device="cpu")  # quantized kernels are CPU-only
+        model[0].auto_model = torch.quantization.quantize_dynamic(
+            model[0].auto_model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+        return model
+    model = SentenceTransformer(EMBEDDING_MODEL)
+    if precision == "fp16" and model.device.type == "cuda":
+        model.half()
+    return model
+
+
+@lru_cache(maxsize=256)
+def _encode_cached(model, query: str) -> tuple[float, ...]:
+    """Embed a query, memoized so re-asked questions skip the forward pass."""
+    return tuple(model.encode(query).tolist())
+
+
 def retrieve_context(index, model, query: str, top_k: int = 5, filter_dict: dict = None, 
                      min_score: float = None) -> list[dict]:
     """Retrieve relevant chunks from Pinecone."""
-    query_embedding = model.encode(query).tolist()
+    query_embedding = list(_encode_cached(model, query))
     
     results = index.query(
         vector=query_embedding,
@@ -68,59 +108,114 @@ def retrieve_context(index, model, query: str, top_k: int = 5, filter_dict: dict
         filter=filter_dict
     )
     
-    contexts = []
-    for match in results.matches:
-        # Skip if below score threshold
-        if min_score is not None and match.score < min_score:
-            continue
-        contexts.append({
+    return matches_to_contexts(results.matches, min_score)
+
+
+def retrieve_contexts_batch(index, model, queries: list[str], top_k: int = 5, filter_dict: dict = None,
+                            min_score: float = None) -> list[list[dict]]:
+    """Retrieve chunks for many queries: one encode call, then concurrent Pinecone queries."""
+    embeddings = model.encode(queries, batch_size=64)
+    
+    futures = [
+        index.query(
+            vector=embedding.tolist(),
+            top_k=top_k,
+            include_metadata=True,
+            filter=filter_dict,
+            async_req=True
+        )
+        for embedding in embeddings
+    ]
+    return [matches_to_contexts(future.result().matches, min_score) for future in futures]
+
+
+def matches_to_contexts(matches, min_score: float = None) -> list[dict]:
+    """Convert Pinecone matches to context dicts, skipping those below the score threshold.
+    
+    Pinecone returns matches best-first, so conversion stops at the first
+    one under the threshold.
+    """
+    threshold = min_score if min_score is not None else float("-inf")
+    return [
+        {
             "text": match.metadata.get("text", ""),
-            "source": match.metadata.get("source", "unknown").upper(),
+            "source": (match.metadata.get("source") or "unknown").upper(),
             "doc_type": match.metadata.get("doc_type", "unknown"),
             "source_file": match.metadata.get("source_file", ""),
             "score": match.score
-        })
+        }
+        for match in takewhile(lambda match: match.score >= threshold, matches)
+    ]
+
+
+def build_filter(field: str, value: str) -> dict:
+    """Pinecone metadata filter for field=value; a comma-separated value matches any of them.
     
-    return contexts
+    Several values become one $in query, so Pinecone returns the merged
+    top-k across them in a single round trip.
+    """
+    values = [v.strip() for v in value.split(",") if v.strip()]
+    if len(values) <= 1:
+        return {field: value.strip()}
+    return {field: {"$in": values}}
 
 
 def format_context_for_prompt(contexts: list[dict]) -> str:
     """Format retrieved contexts for the LLM prompt."""
-    formatted = []
-    for i, ctx in enumerate(contexts, 1):
-        formatted.append(f"""<source id="{i}" origin="{ctx['source']}" type="{ctx['doc_type']}" file="{ctx['source_file']}">
-{ctx['text']}
-</source>""")
-    
-    return "\n\n".join(formatted)
+    return "\n\n".join(
+        f'<source id="{i}" origin="{ctx["source"]}" type="{ctx["doc_type"]}" file="{ctx["source_file"]}">\n'
+        f'{ctx["text"]}\n'
+        f'</source>'
+        for i, ctx in enumerate(contexts, 1)
+    )
 
 
-def generate_answer(client: anthropic.Anthropic, query: str, contexts: list[dict]) -> str:
-    """Generate answer using Claude."""
+def generate_answer(client: anthropic.Anthropic, query: str, contexts: list[dict],
+                    stream: bool = False) -> str:
+    """Generate answer using Claude.
+    
+    With stream=True the answer is printed as tokens arrive (and still returned).
+    """
     context_text = format_context_for_prompt(contexts)
     
-    user_message = f"""Based on the following sources from the O&G knowledge base, please answer the question.
+    # The sources go in their own cached block ahead of the question, so
+    # re-asking against the same retrieved chunks reuses the whole prefix
+    knowledge_block = f"""Based on the following sources from the O&G knowledge base, please answer the question.
 
 <knowledge_base>
 {context_text}
 </knowledge_base>
 
-<question>
+"""
+    question_block = f"""<question>
 {query}
 </question>
 
 Provide a clear, accurate answer based on the sources above. Reference specific sources when making claims."""
 
-    response = client.messages.create(
+    request = dict(
         model=CLAUDE_MODEL,
         max_tokens=MAX_TOKENS,
-        system=SYSTEM_PROMPT,
+        system=SYSTEM_BLOCKS,
         messages=[
-            {"role": "user", "content": user_message}
+            {"role": "user", "content": [
+                {"type": "text", "text": knowledge_block, "cache_control": {"type": "ephemeral"}},
+                {"type": "text", "text": question_block},
+            ]}
         ]
     )
     
-    return response.content[0].text
+    if not stream:
+        response = client.messages.create(**request)
+        return response.content[0].text
+    
+    parts = []
+    with client.messages.stream(**request) as response_stream:
+        for text in response_stream.text_stream:
+            parts.append(text)
+            print(text, end="", flush=True)
+    print()
+    return "".join(parts)
 
 
 def print_sources(contexts: list[dict]):
@@ -140,7 +235,7 @@ def interactive_mode(index, embed_model, claude_client):
     print("O&G RAG Assistant")
     print("=" * 60)
     print("Ask questions about oil & gas safety, regulations, and operations.")
-    print("Commands: /quit, /sources on|off, /topk N, /minscore N, /filter source=X")
+    print("Commands: /quit, /sources on|off, /topk N, /minscore N, /filter source=X[,Y]")
     print("=" * 60)
     
     show_sources = True
@@ -194,7 +289,7 @@ def interactive_mode(index, embed_model, claude_client):
             parts = query.split(" ", 1)
             if len(parts) > 1 and "=" in parts[1]:
                 field, value = parts[1].split("=")
-                current_filter = {field.strip(): value.strip()}
+                current_filter = build_filter(field.strip(), value)
                 print(f"Filter set: {current_filter}")
             else:
                 current_filter = None
@@ -213,25 +308,21 @@ def interactive_mode(index, embed_model, claude_client):
             print_sources(contexts)
         
         print("\n💭 Generating answer...\n")
-        answer = generate_answer(claude_client, query, contexts)
         
-        # Print with word wrap
+        # Stream the answer as it's generated
         print("─" * 60)
-        for line in answer.split('\n'):
-            if line.strip():
-                wrapped = textwrap.fill(line, width=80)
-                print(wrapped)
-            else:
-                print()
+        generate_answer(claude_client, query, contexts, stream=True)
         print("─" * 60)
 
 
 def single_query(index, embed_model, claude_client, query: str, top_k: int = 5, 
-                 filter_dict: dict = None, show_sources: bool = True, min_score: float = None):
-    """Run a single query and print results."""
+                 filter_dict: dict = None, show_sources: bool = True, min_score: float = None,
+                 contexts: list[dict] = None):
+    """Run a single query and print results (retrieving contexts unless given)."""
     print(f"\n🔍 Query: {query}\n")
     
-    contexts = retrieve_context(index, embed_model, query, top_k, filter_dict, min_score)
+    if contexts is None:
+        contexts = retrieve_context(index, embed_model, query, top_k, filter_dict, min_score)
     
     if not contexts:
         print("No relevant documents found.")
@@ -255,14 +346,30 @@ def single_query(index, embed_model, claude_client, query: str, top_k: int = 5,
     print("=" * 60)
 
 
+def batch_queries(index, embed_model, claude_client, queries: list[str], top_k: int = 5,
+                  filter_dict: dict = None, show_sources: bool = True, min_score: float = None):
+    """Run many queries: retrieval for all of them up front, then answers one by one."""
+    print(f"\n🔍 Retrieving context for {len(queries)} queries...")
+    all_contexts = retrieve_contexts_batch(index, embed_model, queries, top_k, filter_dict, min_score)
+    
+    for query, contexts in zip(queries, all_contexts):
+        single_query(index, embed_model, claude_client, query, top_k, filter_dict,
+                     show_sources, min_score, contexts=contexts)
+
+
 def main():
     parser = argparse.ArgumentParser(description="O&G RAG Assistant")
     parser.add_argument("--query", "-q", type=str, help="Single query (non-interactive)")
+    parser.add_argument("--queries-file", type=Path, help="File with one query per line (batch, non-interactive)")
     parser.add_argument("--top-k", "-k", type=int, default=5, help="Number of chunks to retrieve")
     parser.add_argument("--min-score", "-s", type=float, default=None, help="Minimum similarity score threshold")
-    parser.add_argument("--source", type=str, help="Filter by source (bsee, phmsa, osha, csb)")
+    parser.add_argument("--source", type=str, help="Filter by source (bsee, phmsa, osha, csb; comma-separate for several)")
     parser.add_argument("--no-sources", action="store_true", help="Hide source citations")
     parser.add_argument("--model", type=str, default=CLAUDE_MODEL, help="Claude model to use")
+    parser.add_argument("--backend", type=str, default="onnx", choices=["onnx", "torch", "static"],
+                        help="Embedding backend (onnx = INT8 quantized, torch = see --precision, static = Model2Vec)")
+    parser.add_argument("--precision", type=str, default="fp32", choices=["fp32", "fp16", "int8"],
+                        help="Torch backend precision (fp16 = half on GPU, int8 = dynamic quantization on CPU)")
     args = parser.parse_args()
     
     print("Loading API keys and models...")
@@ -271,25 +378,35 @@ def main():
     pinecone_key, anthropic_key = load_keys()
     
     pc = Pinecone(api_key=pinecone_key)
-    index = pc.Index(INDEX_NAME)
+    index = pc.Index(STATIC_INDEX_NAME if args.backend == "static" else INDEX_NAME)
+    
+    # Index stats round trip runs while the embedding model loads
+    stats_executor = ThreadPoolExecutor(max_workers=1)
+    stats_future = stats_executor.submit(index.describe_index_stats)
     
-    print(f"Loading embedding model: {EMBEDDING_MODEL}")
-    embed_model = SentenceTransformer(EMBEDDING_MODEL)
+    model_name = STATIC_EMBEDDING_MODEL if args.backend == "static" else EMBEDDING_MODEL
+    print(f"Loading embedding model: {model_name} ({args.backend})")
+    embed_model = load_embedding_model(args.backend, args.precision)
     
     claude_client = anthropic.Anthropic(api_key=anthropic_key)
     
     # Check index
-    stats = index.describe_index_stats()
+    stats = stats_future.result()
+    stats_executor.shutdown()
     print(f"Connected to Pinecone index with {stats.total_vector_count:,} vectors")
     print(f"Using Claude model: {args.model}")
     
     # Build filter
     filter_dict = None
     if args.source:
-        filter_dict = {"source": args.source}
+        filter_dict = build_filter("source", args.source)
     
     # Run query or interactive mode
-    if args.query:
+    if args.queries_file:
+        queries = [line.strip() for line in args.queries_file.read_text(encoding='utf-8').splitlines() if line.strip()]
+        batch_queries(index, embed_model, claude_client, queries,
+                      args.top_k, filter_dict, not args.no_sources, args.min_score)
+    elif args.query:
         single_query(index, embed_model, claude_client, args.query, 
                     args.top_k, filter_dict, not args.no_sources, args.min_score)
     else:
@@ -5,11 +5,15 @@ Retrieves relevant chunks from Pinecone and generates answers with Claude
 """
 
 from pathlib import Path
-from pinecone import Pinecone
+from pinecone.grpc import PineconeGRPC as Pinecone  # pip install "pinecone[grpc]"
 from openai import OpenAI
 import anthropic
+import numpy as np
 import argparse
 import textwrap
+from concurrent.futures import ThreadPoolExecutor
+from itertools import takewhile
+from functools import lru_cache
 
 # Paths
 PROJECT_ROOT = Path(__file__).parent.parent
@@ -20,8 +24,11 @@ ANTHROPIC_KEY_FILE = PROJECT_ROOT / ".anthropic_api_key"
 # Settings
 INDEX_NAME = "og-rag"
 EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_DIMENSIONS = 1536  # Must match the index (see ingest_pinecone_openai.py)
 CLAUDE_MODEL = "claude-sonnet-4-20250514"
 MAX_TOKENS = 1024
+SEMANTIC_CACHE_SIZE = 1024  # Recent answers kept for reuse in interactive mode
+SEMANTIC_CACHE_THRESHOLD = 0.97  # Cosine similarity at which a past answer is reused
 
 
 SYSTEM_PROMPT = """You are an Oil & Gas domain expert assistant with deep knowledge of:
@@ -41,6 +48,9 @@ When answering questions:
 
 If asked about something outside the O&G domain or not covered in the context, acknowledge the limitation."""
 
+# System prompt as a cacheable block so Claude can reuse the prefix across queries
+SYSTEM_BLOCKS = [{"type": "text", "text": SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}}]
+
 
 def load_keys() -> tuple[str, str, str]:
     """Load API keys from files."""
@@ -50,19 +60,73 @@ def load_keys() -> tuple[str, str, str]:
     return pinecone_key, openai_key, anthropic_key
 
 
-def get_embedding(text: str, client: OpenAI) -> list[float]:
-    """Get embedding from OpenAI."""
+def get_embeddings_batch(texts: list[str], client: OpenAI) -> list[list[float]]:
+    """Get embeddings for many texts from OpenAI in one request (results align with texts)."""
     response = client.embeddings.create(
         model=EMBEDDING_MODEL,
-        input=text
+        input=texts,
+        dimensions=EMBEDDING_DIMENSIONS
     )
-    return response.data[0].embedding
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+
+def get_embedding(text: str, client: OpenAI) -> list[float]:
+    """Get embedding from OpenAI."""
+    return get_embeddings_batch([text], client)[0]
+
+
+def embedding_text(query: str) -> str:
+    """Collapse whitespace only; case is what tells BOP or H2S apart from ordinary words."""
+    return " ".join(query.split())
+
+
+@lru_cache(maxsize=2048)
+def _embed_cached(query_text: str, client: OpenAI) -> tuple[float, ...]:
+    """Embed a query (as given by embedding_text), memoized so repeat questions skip the OpenAI call."""
+    return tuple(get_embedding(query_text, client))
+
+
+class SemanticCache:
+    """Recent answers, reused when a new query embeds almost identically to an old one.
+    
+    Embeddings live in a fixed ring buffer, so a lookup is one matrix-vector
+    product (OpenAI embeddings are unit length, so dot product = cosine).
+    Entries only match under the same retrieval settings.
+    """
+    
+    def __init__(self, size: int = SEMANTIC_CACHE_SIZE, threshold: float = SEMANTIC_CACHE_THRESHOLD):
+        self.vectors = np.zeros((size, EMBEDDING_DIMENSIONS), dtype=np.float32)
+        self.entries = [None] * size  # (settings, contexts, answer)
+        self.count = 0
+        self.threshold = threshold
+    
+    def lookup(self, embedding, settings) -> tuple[list[dict], str, float] | None:
+        """Return (contexts, answer, similarity) for the closest cached query, if close enough."""
+        filled = min(self.count, len(self.entries))
+        if not filled:
+            return None
+        sims = self.vectors[:filled] @ np.asarray(embedding, dtype=np.float32)
+        for i in range(filled):
+            if self.entries[i][0] != settings:
+                sims[i] = -np.inf
+        best = int(sims.argmax())
+        if sims[best] < self.threshold:
+            return None
+        _, contexts, answer = self.entries[best]
+        return contexts, answer, float(sims[best])
+    
+    def add(self, embedding, settings, contexts: list[dict], answer: str):
+        """Store an answer, overwriting the oldest entry once full."""
+        slot = self.count % len(self.entries)
+        self.vectors[slot] = embedding
+        self.entries[slot] = (settings, contexts, answer)
+        self.count += 1
 
 
 def retrieve_context(index, openai_client: OpenAI, query: str, top_k: int = 5, 
                      filter_dict: dict = None, min_score: float = None) -> list[dict]:
     """Retrieve relevant chunks from Pinecone."""
-    query_embedding = get_embedding(query, openai_client)
+    query_embedding = list(_embed_cached(embedding_text(query), openai_client))
     
     results = index.query(
         vector=query_embedding,
@@ -71,59 +135,141 @@ def retrieve_context(index, openai_client: OpenAI, query: str, top_k: int = 5,
         filter=filter_dict
     )
     
-    contexts = []
-    for match in results.matches:
-        # Skip if below score threshold
-        if min_score is not None and match.score < min_score:
-            continue
-        contexts.append({
+    return matches_to_contexts(results.matches, min_score)
+
+
+def retrieve_contexts_batch(index, openai_client: OpenAI, queries: list[str], top_k: int = 5,
+                            filter_dict: dict = None, min_score: float = None) -> list[list[dict]]:
+    """Retrieve chunks for many queries: one embeddings request, then concurrent Pinecone queries.
+    
+    Queries that differ only in whitespace are embedded and searched once.
+    This is the entry point for running many questions from code (see batch_queries).
+    """
+    normalized = [embedding_text(q) for q in queries]
+    unique = list(dict.fromkeys(normalized))
+    embeddings = get_embeddings_batch(unique, openai_client)
+    
+    futures = [
+        index.query(
+            vector=embedding,
+            top_k=top_k,
+            include_metadata=True,
+            filter=filter_dict,
+            async_req=True
+        )
+        for embedding in embeddings
+    ]
+    by_query = {q: matches_to_contexts(future.result().matches, min_score) for q, future in zip(unique, futures)}
+    return [by_query[q] for q in normalized]
+
+
+def matches_to_contexts(matches, min_score: float = None) -> list[dict]:
+    """Convert Pinecone matches to context dicts, skipping those below the score threshold.
+    
+    Pinecone returns matches best-first, so conversion stops at the first
+    one under the threshold.
+    """
+    threshold = min_score if min_score is not None else float("-inf")
+    return [
+        {
             "text": match.metadata.get("text", ""),
-            "source": match.metadata.get("source", "unknown").upper(),
+            "source": (match.metadata.get("source") or "unknown").upper(),
             "doc_type": match.metadata.get("doc_type", "unknown"),
             "source_file": match.metadata.get("source_file", ""),
             "score": match.score
-        })
+        }
+        for match in takewhile(lambda match: match.score >= threshold, matches)
+    ]
+
+
+def build_filter(field: str, value: str) -> dict:
+    """Pinecone metadata filter for field=value; a comma-separated value matches any of them.
     
-    return contexts
+    Several values become one $in query, so Pinecone returns the merged
+    top-k across them in a single round trip.
+    """
+    values = [v.strip() for v in value.split(",") if v.strip()]
+    if len(values) <= 1:
+        return {field: value.strip()}
+    return {field: {"$in": values}}
 
 
 def format_context_for_prompt(contexts: list[dict]) -> str:
     """Format retrieved contexts for the LLM prompt."""
-    formatted = []
-    for i, ctx in enumerate(contexts, 1):
-        formatted.append(f"""<source id="{i}" origin="{ctx['source']}" type="{ctx['doc_type']}" file="{ctx['source_file']}">
-{ctx['text']}
-</source>""")
-    
-    return "\n\n".join(formatted)
+    return "\n\n".join(
+        f'<source id="{i}" origin="{ctx["source"]}" type="{ctx["doc_type"]}" file="{ctx["source_file"]}">\n'
+        f'{ctx["text"]}\n'
+        f'</source>'
+        for i, ctx in enumerate(contexts, 1)
+    )
 
 
-def generate_answer(client: anthropic.Anthropic, query: str, contexts: list[dict]) -> str:
-    """Generate answer using Claude."""
+def generate_answer(client: anthropic.Anthropic, query: str, contexts: list[dict],
+                    stream: bool = False) -> str:
+    """Generate answer using Claude.
+    
+    With stream=True each line is printed (word-wrapped) as soon as it is
+    complete, and the full answer is still returned.
+    """
     context_text = format_context_for_prompt(contexts)
     
-    user_message = f"""Based on the following sources from the O&G knowledge base, please answer the question.
+    # The sources go in their own cached block ahead of the question, so
+    # re-asking against the same retrieved chunks reuses the whole prefix
+    knowledge_block = f"""Based on the following sources from the O&G knowledge base, please answer the question.
 
 <knowledge_base>
 {context_text}
 </knowledge_base>
 
-<question>
+"""
+    question_block = f"""<question>
 {query}
 </question>
 
 Provide a clear, accurate answer based on the sources above. Reference specific sources when making claims."""
 
-    response = client.messages.create(
+    request = dict(
         model=CLAUDE_MODEL,
         max_tokens=MAX_TOKENS,
-        system=SYSTEM_PROMPT,
+        system=SYSTEM_BLOCKS,
         messages=[
-            {"role": "user", "content": user_message}
+            {"role": "user", "content": [
+                {"type": "text", "text": knowledge_block, "cache_control": {"type": "ephemeral"}},
+                {"type": "text", "text": question_block},
+            ]}
         ]
     )
     
-    return response.content[0].text
+    if not stream:
+        response = client.messages.create(**request)
+        return response.content[0].text
+    
+    parts = []
+    pending = ""
+    with client.messages.stream(**request) as response_stream:
+        for text in response_stream.text_stream:
+            parts.append(text)
+            pending += text
+            *lines, pending = pending.split("\n")
+            for line in lines:
+                print_answer_line(line)
+    if pending:
+        print_answer_line(pending)
+    return "".join(parts)
+
+
+def print_answer_line(line: str):
+    """Print one line of an answer, word-wrapped to 80 columns."""
+    if line.strip():
+        print(textwrap.fill(line, width=80), flush=True)
+    else:
+        print(flush=True)
+
+
+def print_answer(answer: str):
+    """Print a whole answer, word-wrapped."""
+    for line in answer.split('\n'):
+        print_answer_line(line)
 
 
 def print_sources(contexts: list[dict]):
@@ -143,13 +289,15 @@ def interactive_mode(index, openai_client, claude_client):
     print("O&G RAG Assistant (OpenAI Embeddings)")
     print("=" * 60)
     print("Ask questions about oil & gas safety, regulations, and operations.")
-    print("Commands: /quit, /sources on|off, /topk N, /minscore N, /filter source=X")
+    print("Commands: /quit, /sources on|off, /topk N, /minscore N, /filter source=X[,Y], /cachestats")
+    print("          /batch Q1; Q2; ...  (several questions, embedded in one request)")
     print("=" * 60)
     
     show_sources = True
     top_k = 10
     min_score = 0.5
     current_filter = None
+    semantic_cache = SemanticCache()
     
     while True:
         try:
@@ -165,6 +313,23 @@ def interactive_mode(index, openai_client, claude_client):
             print("Goodbye!")
             break
         
+        if query == "/cachestats":
+            info = _embed_cached.cache_info()
+            lookups = info.hits + info.misses
+            hit_rate = info.hits / lookups if lookups else 0.0
+            print(f"Embedding cache: {info.hits} hits, {info.misses} misses, "
+                  f"hit rate {hit_rate:.0%} ({info.currsize}/{info.maxsize} entries)")
+            continue
+        
+        if query.startswith("/batch"):
+            queries = [q.strip() for q in query[len("/batch"):].split(";") if q.strip()]
+            if queries:
+                batch_queries(index, openai_client, claude_client, queries,
+                              top_k, current_filter, show_sources, min_score)
+            else:
+                print("Usage: /batch question one; question two; ...")
+            continue
+        
         if query.startswith("/sources"):
             parts = query.split()
             if len(parts) > 1:
@@ -197,44 +362,54 @@ def interactive_mode(index, openai_client, claude_client):
             parts = query.split(" ", 1)
             if len(parts) > 1 and "=" in parts[1]:
                 field, value = parts[1].split("=")
-                current_filter = {field.strip(): value.strip()}
+                current_filter = build_filter(field.strip(), value)
                 print(f"Filter set: {current_filter}")
             else:
                 current_filter = None
                 print("Filter cleared")
             continue
         
-        # Retrieve and generate
+        # Reuse the answer to a near-identical earlier question, else retrieve and generate
         print("\n🔍 Searching knowledge base...")
-        contexts = retrieve_context(index, openai_client, query, top_k, current_filter, min_score)
+        query_embedding = _embed_cached(embedding_text(query), openai_client)
+        settings = (top_k, repr(current_filter), min_score)
+        hit = semantic_cache.lookup(query_embedding, settings)
         
-        if not contexts:
-            print("No relevant documents found.")
-            continue
+        if hit:
+            contexts, answer, similarity = hit
+            print(f"♻️  Reusing the answer to a similar question (similarity {similarity:.3f})")
+        else:
+            contexts = retrieve_context(index, openai_client, query, top_k, current_filter, min_score)
+            if not contexts:
+                print("No relevant documents found.")
+                continue
         
         if show_sources:
             print_sources(contexts)
         
+        if hit:
+            print("─" * 60)
+            print_answer(answer)
+            print("─" * 60)
+            continue
+        
         print("\n💭 Generating answer...\n")
-        answer = generate_answer(claude_client, query, contexts)
         
-        # Print with word wrap
+        # Stream the answer as it's generated
         print("─" * 60)
-        for line in answer.split('\n'):
-            if line.strip():
-                wrapped = textwrap.fill(line, width=80)
-                print(wrapped)
-            else:
-                print()
+        answer = generate_answer(claude_client, query, contexts, stream=True)
         print("─" * 60)
+        semantic_cache.add(query_embedding, settings, contexts, answer)
 
 
 def single_query(index, openai_client, claude_client, query: str, top_k: int = 10, 
-                 filter_dict: dict = None, show_sources: bool = True, min_score: float = 0.5):
-    """Run a single query and print results."""
+                 filter_dict: dict = None, show_sources: bool = True, min_score: float = 0.5,
+                 contexts: list[dict] = None):
+    """Run a single query and print results (retrieving contexts unless given)."""
     print(f"\n🔍 Query: {query}\n")
     
-    contexts = retrieve_context(index, openai_client, query, top_k, filter_dict, min_score)
+    if contexts is None:
+        contexts = retrieve_context(index, openai_client, query, top_k, filter_dict, min_score)
     
     if not contexts:
         print("No relevant documents found.")
@@ -244,26 +419,32 @@ def single_query(index, openai_client, claude_client, query: str, top_k: int = 1
         print_sources(contexts)
     
     print("\n💭 Generating answer...\n")
-    answer = generate_answer(claude_client, query, contexts)
     
     print("=" * 60)
     print("ANSWER:")
     print("=" * 60)
-    for line in answer.split('\n'):
-        if line.strip():
-            wrapped = textwrap.fill(line, width=80)
-            print(wrapped)
-        else:
-            print()
+    generate_answer(claude_client, query, contexts, stream=True)
     print("=" * 60)
 
 
+def batch_queries(index, openai_client, claude_client, queries: list[str], top_k: int = 10,
+                  filter_dict: dict = None, show_sources: bool = True, min_score: float = 0.5):
+    """Run many queries: retrieval for all of them up front, then answers one by one."""
+    print(f"\n🔍 Retrieving context for {len(queries)} queries...")
+    all_contexts = retrieve_contexts_batch(index, openai_client, queries, top_k, filter_dict, min_score)
+    
+    for query, contexts in zip(queries, all_contexts):
+        single_query(index, openai_client, claude_client, query, top_k, filter_dict,
+                     show_sources, min_score, contexts=contexts)
+
+
 def main():
     parser = argparse.ArgumentParser(description="O&G RAG Assistant (OpenAI Embeddings)")
     parser.add_argument("--query", "-q", type=str, help="Single query (non-interactive)")
+    parser.add_argument("--queries-file", type=Path, help="File with one query per line (batch, non-interactive)")
     parser.add_argument("--top-k", "-k", type=int, default=10, help="Number of chunks to retrieve")
     parser.add_argument("--min-score", "-s", type=float, default=0.5, help="Minimum similarity score threshold")
-    parser.add_argument("--source", type=str, help="Filter by source (bsee, phmsa, osha, csb)")
+    parser.add_argument("--source", type=str, help="Filter by source (bsee, phmsa, osha, csb; comma-separate for several)")
     parser.add_argument("--no-sources", action="store_true", help="Hide source citations")
     args = parser.parse_args()
     
@@ -281,11 +462,16 @@ def main():
     pc = Pinecone(api_key=pinecone_key)
     index = pc.Index(INDEX_NAME)
     
+    # Index stats round trip runs while the API clients are set up
+    stats_executor = ThreadPoolExecutor(max_workers=1)
+    stats_future = stats_executor.submit(index.describe_index_stats)
+    
     openai_client = OpenAI(api_key=openai_key)
     claude_client = anthropic.Anthropic(api_key=anthropic_key)
     
     # Check index
-    stats = index.describe_index_stats()
+    stats = stats_future.result()
+    stats_executor.shutdown()
     print(f"Connected to Pinecone index with {stats.total_vector_count:,} vectors")
     print(f"Using OpenAI embedding model: {EMBEDDING_MODEL}")
     print(f"Using Claude model: {CLAUDE_MODEL}")
@@ -293,10 +479,14 @@ def main():
     # Build filter
     filter_dict = None
     if args.source:
-        filter_dict = {"source": args.source}
+        filter_dict = build_filter("source", args.source)
     
     # Run query or interactive mode
-    if args.query:
+    if args.queries_file:
+        queries = [line.strip() for line in args.queries_file.read_text(encoding='utf-8').splitlines() if line.strip()]
+        batch_queries(index, openai_client, claude_client, queries,
+                      args.top_k, filter_dict, not args.no_sources, args.min_score)
+    elif args.query:
         single_query(index, openai_client, claude_client, args.query, 
                     args.top_k, filter_dict, not args.no_sources, args.min_score)
     else:
@@ -11,37 +11,83 @@ Tested structure as of Dec 2025:
 """
 
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from bs4 import BeautifulSoup, SoupStrainer
 from pathlib import Path
 import time
+import orjson
+import os
+import shutil
+import importlib.util
+import random
 import re
+import hashlib
 from urllib.parse import urljoin
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 BASE_URL = "https://www.bsee.gov"
 LISTING_URL = f"{BASE_URL}/guidance-and-regulations/guidance/safety-alerts-program"
 OUTPUT_DIR = Path("data/raw/bsee_safety_alerts")
+DOWNLOADS_FILE = OUTPUT_DIR / "downloads.json"  # PDF URL -> saved file + SHA-256
+MANIFEST_FILE = OUTPUT_DIR / "manifest.json"  # Alert listing + per-alert status, for resuming
+MANIFEST_MAX_AGE = 24 * 3600  # Reuse listings younger than this (seconds) instead of re-fetching
+PDF_URLS_FILE = OUTPUT_DIR / "pdf_urls.json"  # Detail page URL -> PDF URL
+
+# C parser for BeautifulSoup when installed (pip install lxml)
+HTML_PARSER = 'lxml' if importlib.util.find_spec('lxml') else 'html.parser'
 
 # Be a good citizen
 HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
 }
+MAX_WORKERS = 5  # Concurrent requests to bsee.gov
+
+# One keep-alive session shared by all workers (pool sized above MAX_WORKERS),
+# retrying transient errors with backoff
+SESSION = requests.Session()
+SESSION.headers.update(HEADERS)
+_adapter = HTTPAdapter(pool_connections=10, pool_maxsize=10,
+                       max_retries=Retry(total=3, backoff_factor=0.5,
+                                         status_forcelist=[429, 500, 502, 503, 504]))
+SESSION.mount("https://", _adapter)
+SESSION.mount("http://", _adapter)
+
+
+def polite_pause():
+    """Per-worker rate limiting, jittered so the workers don't fire in lockstep."""
+    time.sleep(random.uniform(0.8, 1.2))
+
+
+def fetch_listing_page(page_url: str) -> bytes | None:
+    """Fetch one listing page, returning its HTML (None on error)."""
+    try:
+        response = SESSION.get(page_url, timeout=30)
+        response.raise_for_status()
+    except requests.RequestException as e:
+        print(f"Error fetching {page_url}: {e}")
+        return None
+    finally:
+        polite_pause()
+    return response.content
+
 
 def get_alert_pages(listing_url: str, max_pages: int = 15) -> list[dict]:
     """Get all alert detail page URLs from the paginated listing."""
     all_alerts = []
     
-    for page_num in range(max_pages):
-        page_url = f"{listing_url}?page={page_num}"
-        print(f"Fetching listing page {page_num}...")
-        
-        try:
-            response = requests.get(page_url, headers=HEADERS, timeout=30)
-            response.raise_for_status()
-        except requests.RequestException as e:
-            print(f"Error fetching {page_url}: {e}")
+    # Fetch the pages concurrently, then parse them in order so the first
+    # missing/empty page still ends the listing
+    page_urls = [f"{listing_url}?page={page_num}" for page_num in range(max_pages)]
+    print(f"Fetching up to {max_pages} listing pages...")
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        pages = list(executor.map(fetch_listing_page, page_urls))
+    
+    for page_num, content in enumerate(pages):
+        if content is None:
             break
         
-        soup = BeautifulSoup(response.content, 'html.parser')
+        soup = BeautifulSoup(content, HTML_PARSER, parse_only=SoupStrainer('table'))
         
         # Find the table with safety alerts
         table = soup.find('table')
@@ -76,21 +122,24 @@ def get_alert_pages(listing_url: str, max_pages: int = 15) -> list[dict]:
                     all_alerts.append(alert_info)
         
         print(f"  Found {len(rows)} alerts on page {page_num}")
-        time.sleep(1)  # Rate limiting
     
     return all_alerts
 
 
+# Only build the <a href> tags when looking for PDF links
+_LINKS = SoupStrainer('a', href=True)
+
+
 def get_pdf_from_detail_page(detail_url: str) -> str | None:
     """Visit detail page and extract PDF URL."""
     try:
-        response = requests.get(detail_url, headers=HEADERS, timeout=30)
+        response = SESSION.get(detail_url, timeout=30)
         response.raise_for_status()
     except requests.RequestException as e:
         print(f"  Error fetching detail page: {e}")
         return None
     
-    soup = BeautifulSoup(response.content, 'html.parser')
+    soup = BeautifulSoup(response.content, HTML_PARSER, parse_only=_LINKS)
     
     # Look for PDF links
     for link in soup.find_all('a', href=True):
@@ -101,31 +150,128 @@ def get_pdf_from_detail_page(detail_url: str) -> str | None:
     return None
 
 
-def download_pdf(pdf_url: str, output_path: Path) -> bool:
-    """Download PDF file."""
+def download_pdf(pdf_url: str, output_path: Path) -> str | None:
+    """Download PDF file, streaming it straight to disk. Returns its SHA-256 (None on failure)."""
+    # Written beside the final name, which only appears once the PDF is complete
+    part = output_path.with_name(output_path.name + '.part')
     try:
-        response = requests.get(pdf_url, headers=HEADERS, timeout=60)
-        response.raise_for_status()
-        
-        # Verify it's actually a PDF
-        if response.content[:4] != b'%PDF':
-            print(f"  Not a valid PDF: {pdf_url}")
-            return False
-        
-        output_path.write_bytes(response.content)
-        return True
+        with SESSION.get(pdf_url, timeout=60, stream=True) as response:
+            response.raise_for_status()
+            chunks = response.iter_content(chunk_size=65536)
+            
+            # Verify it's actually a PDF
+            first = next(chunks, b'')
+            if first[:4] != b'%PDF':
+                print(f"  Not a valid PDF: {pdf_url}")
+                return None
+            
+            digest = hashlib.sha256(first)
+            with open(part, 'wb') as f:
+                f.write(first)
+                for chunk in chunks:
+                    digest.update(chunk)
+                    f.write(chunk)
+            os.replace(part, output_path)
+        return digest.hexdigest()
         
     except requests.RequestException as e:
         print(f"  Error downloading PDF: {e}")
-        return False
+        return None
+    finally:
+        part.unlink(missing_ok=True)  # left over only if the download was cut short
+
+
+def process_alert(alert: dict, output_path: Path,
+                  pdf_url: str | None = None) -> tuple[str, str | None, str | None]:
+    """Find and download one alert's PDF. Returns (status, pdf_url, sha256).
+    
+    A pdf_url already known from an earlier run skips the detail page fetch.
+    """
+    try:
+        # Get PDF URL from detail page
+        if not pdf_url:
+            pdf_url = get_pdf_from_detail_page(alert['detail_url'])
+        if not pdf_url:
+            return "no_pdf", None, None
+        
+        sha256 = download_pdf(pdf_url, output_path)
+        if sha256:
+            return "ok", pdf_url, sha256
+        return "failed", pdf_url, None
+    finally:
+        polite_pause()
+
+
+def load_json(path: Path) -> dict:
+    """Load a JSON cache file, or an empty dict if it's missing or unreadable."""
+    try:
+        return orjson.loads(path.read_bytes())
+    except (OSError, ValueError):
+        return {}
+
+
+def save_json(path: Path, data):
+    """Write a JSON cache file atomically (a crash never leaves it half-written)."""
+    tmp = path.with_suffix(path.suffix + '.tmp')
+    tmp.write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+    os.replace(tmp, path)
+
+
+def link_existing(existing: Path, output_path: Path):
+    """Save output_path as a hard link to an already-downloaded copy (plain copy if linking fails)."""
+    try:
+        os.link(existing, output_path)
+    except OSError:
+        shutil.copyfile(existing, output_path)
+
+
+class DownloadRecord:
+    """PDFs already saved, by URL and by content hash, kept across runs in DOWNLOADS_FILE."""
+    
+    def __init__(self, path: Path = None):
+        self.path = path or DOWNLOADS_FILE
+        self.by_url = load_json(self.path)  # pdf_url -> {"file": ..., "sha256": ...}
+        self.by_sha = {entry['sha256']: entry['file'] for entry in self.by_url.values()}
+    
+    def existing_copy(self, pdf_url: str) -> Path | None:
+        """A file already holding this URL's PDF, if it is still on disk."""
+        entry = self.by_url.get(pdf_url)
+        if entry and (OUTPUT_DIR / entry['file']).exists():
+            return OUTPUT_DIR / entry['file']
+        return None
+    
+    def add(self, pdf_url: str, output_path: Path, sha256: str) -> bool:
+        """Record a finished download, swapping it for a link if the same bytes are already saved.
+        
+        Returns True if the file was deduplicated.
+        """
+        existing = self.by_sha.get(sha256)
+        deduped = (existing is not None and existing != output_path.name
+                   and (OUTPUT_DIR / existing).exists())
+        if deduped:
+            output_path.unlink()
+            link_existing(OUTPUT_DIR / existing, output_path)
+        else:
+            self.by_sha[sha256] = output_path.name
+        self.by_url[pdf_url] = {'file': output_path.name, 'sha256': sha256}
+        return deduped
+    
+    def save(self):
+        save_json(self.path, self.by_url)
+
+
+# sanitize_filename patterns
+_UNSAFE_CHARS = re.compile(r'[<>:"/\\|?*]')
+_WHITESPACE = re.compile(r'\s+')
+_UNDERSCORES = re.compile(r'_+')
 
 
 def sanitize_filename(name: str, max_length: int = 100) -> str:
     """Create a safe filename."""
     # Remove/replace problematic characters
-    safe = re.sub(r'[<>:"/\\|?*]', '_', name)
-    safe = re.sub(r'\s+', '_', safe)
-    safe = re.sub(r'_+', '_', safe)
+    safe = _UNSAFE_CHARS.sub('_', name)
+    safe = _WHITESPACE.sub('_', safe)
+    safe = _UNDERSCORES.sub('_', safe)
     safe = safe.strip('_.')
     
     # Truncate if needed
@@ -145,9 +291,17 @@ def main():
     print("BSEE Safety Alerts Scraper")
     print("=" * 60)
     
-    # Step 1: Get all alert listings
-    print("\nStep 1: Fetching alert listings...")
-    alerts = get_alert_pages(LISTING_URL)
+    # Step 1: Get all alert listings (reusing a recent manifest from an interrupted run)
+    manifest = load_json(MANIFEST_FILE)
+    if manifest and time.time() - manifest.get('fetched_at', 0) < MANIFEST_MAX_AGE:
+        print(f"\nStep 1: Using alert listing from {MANIFEST_FILE} (less than a day old)")
+        alerts = manifest['alerts']
+    else:
+        print("\nStep 1: Fetching alert listings...")
+        alerts = get_alert_pages(LISTING_URL)
+        manifest = {'fetched_at': time.time(), 'alerts': alerts}
+        if alerts:
+            save_json(MANIFEST_FILE, manifest)
     print(f"\nFound {len(alerts)} total alerts")
     
     if not alerts:
@@ -160,50 +314,90 @@ def main():
     skipped = 0
     failed = 0
     
+    # What earlier runs found and saved, so repeats skip the fetch or the download
+    pdf_urls = load_json(PDF_URLS_FILE)
+    record = DownloadRecord()
+    
     with open(log_file, 'w') as log:
         log.write("BSEE Safety Alerts Download Log\n")
         log.write("=" * 60 + "\n\n")
         
-        for i, alert in enumerate(alerts):
-            number = alert['number']
-            title = alert['title']
-            
-            # Create filename
-            filename = f"BSEE_Alert_{number}_{sanitize_filename(title)}.pdf"
-            output_path = OUTPUT_DIR / filename
-            
-            # Skip if already exists
-            if output_path.exists():
-                print(f"[{i+1}/{len(alerts)}] Already exists: {filename[:50]}...")
-                skipped += 1
-                continue
-            
-            print(f"[{i+1}/{len(alerts)}] Processing Alert {number}: {title[:40]}...")
-            
-            # Get PDF URL from detail page
-            pdf_url = get_pdf_from_detail_page(alert['detail_url'])
-            
-            if not pdf_url:
-                print(f"  No PDF found on detail page")
-                log.write(f"NO PDF: {number} - {title}\n")
-                log.write(f"  Detail URL: {alert['detail_url']}\n\n")
-                failed += 1
-                time.sleep(0.5)
-                continue
-            
-            # Download PDF
-            if download_pdf(pdf_url, output_path):
-                print(f"  -> Saved: {filename[:50]}...")
-                log.write(f"OK: {number} - {title}\n")
-                log.write(f"  PDF: {pdf_url}\n")
-                log.write(f"  File: {filename}\n\n")
-                downloaded += 1
-            else:
-                log.write(f"FAILED: {number} - {title}\n")
-                log.write(f"  PDF URL: {pdf_url}\n\n")
-                failed += 1
+        # Detail page + PDF download for each alert run on a small worker
+        # pool; results (and log writes) are handled here as they finish
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            futures = {}
+            for alert in alerts:
+                # Create filename
+                filename = f"BSEE_Alert_{alert['number']}_{sanitize_filename(alert['title'])}.pdf"
+                output_path = OUTPUT_DIR / filename
+                
+                # Skip if already exists
+                if output_path.exists():
+                    print(f"Already exists: {filename[:50]}...")
+                    skipped += 1
+                    continue
+                
+                # Detail page had no PDF when this listing was fetched
+                if alert.get('status') == "no_pdf":
+                    print(f"No PDF last run: {filename[:50]}...")
+                    skipped += 1
+                    continue
+                
+                # Same PDF already saved under another name: link it, no request needed
+                pdf_url = pdf_urls.get(alert['detail_url'])
+                existing = pdf_url and record.existing_copy(pdf_url)
+                if existing:
+                    link_existing(existing, output_path)
+                    print(f"Linked to existing copy: {filename[:50]}...")
+                    log.write(f"OK: {alert['number']} - {alert['title']}\n")
+                    log.write(f"  PDF: {pdf_url}\n")
+                    log.write(f"  File: {filename} (linked to {existing.name})\n\n")
+                    alert['status'] = "ok"
+                    downloaded += 1
+                    continue
+                
+                futures[executor.submit(process_alert, alert, output_path, pdf_url)] = (alert, filename)
             
-            time.sleep(1)  # Rate limiting
+            for i, future in enumerate(as_completed(futures)):
+                alert, filename = futures[future]
+                number = alert['number']
+                title = alert['title']
+                status, pdf_url, sha256 = future.result()
+                
+                # Checkpoint per-alert status so an interrupted run resumes cheaply
+                alert['status'] = status
+                if (i + 1) % 10 == 0:
+                    save_json(MANIFEST_FILE, manifest)
+                
+                # Remember where each detail page's PDF lives, forgetting URLs that failed
+                if status == "failed":
+                    pdf_urls.pop(alert['detail_url'], None)
+                elif pdf_url:
+                    pdf_urls[alert['detail_url']] = pdf_url
+                
+                print(f"[{i+1}/{len(futures)}] Alert {number}: {title[:40]}...")
+                
+                if status == "no_pdf":
+                    print(f"  No PDF found on detail page")
+                    log.write(f"NO PDF: {number} - {title}\n")
+                    log.write(f"  Detail URL: {alert['detail_url']}\n\n")
+                    failed += 1
+                elif status == "ok":
+                    if record.add(pdf_url, OUTPUT_DIR / filename, sha256):
+                        print("  (identical to an existing file; hard-linked)")
+                    print(f"  -> Saved: {filename[:50]}...")
+                    log.write(f"OK: {number} - {title}\n")
+                    log.write(f"  PDF: {pdf_url}\n")
+                    log.write(f"  File: {filename}\n\n")
+                    downloaded += 1
+                else:
+                    log.write(f"FAILED: {number} - {title}\n")
+                    log.write(f"  PDF URL: {pdf_url}\n\n")
+                    failed += 1
+    
+    save_json(MANIFEST_FILE, manifest)
+    save_json(PDF_URLS_FILE, pdf_urls)
+    record.save()
     
     # Summary
     print("\n" + "=" * 60)
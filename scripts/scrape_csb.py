@@ -7,19 +7,44 @@ Fixes:
 """
 
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from bs4 import BeautifulSoup, SoupStrainer
 from pathlib import Path
 import time
+import orjson
+import os
+import shutil
+import importlib.util
+import random
 import re
 from urllib.parse import urljoin
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import hashlib
 
 BASE_URL = "https://www.csb.gov"
 OUTPUT_DIR = Path("data/raw/csb_reports")
+DOWNLOADS_FILE = OUTPUT_DIR / "downloads.json"  # PDF URL -> saved file + SHA-256
+MANIFEST_FILE = OUTPUT_DIR / "manifest.json"  # Documents found per investigation, for resuming
+MANIFEST_MAX_AGE = 24 * 3600  # Reuse listings younger than this (seconds) instead of re-fetching
+
+# C parser for BeautifulSoup when installed (pip install lxml)
+HTML_PARSER = 'lxml' if importlib.util.find_spec('lxml') else 'html.parser'
 
 HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
 }
+MAX_WORKERS = 5  # Concurrent requests to csb.gov
+
+# One keep-alive session shared by all workers (pool sized above MAX_WORKERS),
+# retrying transient errors with backoff
+SESSION = requests.Session()
+SESSION.headers.update(HEADERS)
+_adapter = HTTPAdapter(pool_connections=10, pool_maxsize=10,
+                       max_retries=Retry(total=3, backoff_factor=0.5,
+                                         status_forcelist=[429, 500, 502, 503, 504]))
+SESSION.mount("https://", _adapter)
+SESSION.mount("http://", _adapter)
 
 # Known O&G / Refinery investigation URLs (verified Dec 2025)
 KNOWN_INVESTIGATIONS = [
@@ -43,16 +68,37 @@ KNOWN_INVESTIGATIONS = [
 ]
 
 
+def polite_pause():
+    """Per-worker rate limiting, jittered so the workers don't fire in lockstep."""
+    time.sleep(random.uniform(0.8, 1.2))
+
+
+# Link-text keywords -> doc_type, in priority order
+_DOC_TYPE_RULES = [
+    (('report', 'investigation'), "final_report"),
+    (('interim',), "interim_report"),
+    (('case study',), "case_study"),
+    (('factual',), "factual_update"),
+    (('recommendation',), "recommendation"),
+    (('appendix',), "appendix"),
+    (('letter',), "letter"),
+    (('transcript',), "transcript"),
+]
+
+# Only build the <a href> tags when looking for PDF links
+_LINKS = SoupStrainer('a', href=True)
+
+
 def get_documents_from_page(detail_url: str, investigation_name: str) -> list[dict]:
     """Get all PDF documents from an investigation page."""
     try:
-        response = requests.get(detail_url, headers=HEADERS, timeout=30)
+        response = SESSION.get(detail_url, timeout=30)
         response.raise_for_status()
     except requests.RequestException as e:
         print(f"  Error fetching {detail_url}: {e}")
         return []
     
-    soup = BeautifulSoup(response.content, 'html.parser')
+    soup = BeautifulSoup(response.content, HTML_PARSER, parse_only=_LINKS)
     documents = []
     
     for link in soup.find_all('a', href=True):
@@ -66,25 +112,10 @@ def get_documents_from_page(detail_url: str, investigation_name: str) -> list[di
             if 'video' in text.lower():
                 continue
             
-            # Determine document type
-            doc_type = "document"
+            # Determine document type (first matching rule wins)
             text_lower = text.lower()
-            if 'report' in text_lower and 'investigation' in text_lower:
-                doc_type = "final_report"
-            elif 'interim' in text_lower:
-                doc_type = "interim_report"
-            elif 'case study' in text_lower:
-                doc_type = "case_study"
-            elif 'factual' in text_lower:
-                doc_type = "factual_update"
-            elif 'recommendation' in text_lower:
-                doc_type = "recommendation"
-            elif 'appendix' in text_lower:
-                doc_type = "appendix"
-            elif 'letter' in text_lower:
-                doc_type = "letter"
-            elif 'transcript' in text_lower:
-                doc_type = "transcript"
+            doc_type = next((t for words, t in _DOC_TYPE_RULES
+                             if all(w in text_lower for w in words)), "document")
             
             documents.append({
                 'title': text or href.split('/')[-1],
@@ -96,29 +127,124 @@ def get_documents_from_page(detail_url: str, investigation_name: str) -> list[di
     return documents
 
 
-def download_pdf(pdf_url: str, output_path: Path) -> bool:
-    """Download PDF file."""
+def download_pdf(pdf_url: str, output_path: Path) -> str | None:
+    """Download PDF file, streaming it straight to disk. Returns its SHA-256 (None on failure)."""
+    # Written beside the final name, which only appears once the PDF is complete
+    part = output_path.with_name(output_path.name + '.part')
     try:
-        response = requests.get(pdf_url, headers=HEADERS, timeout=120)
-        response.raise_for_status()
-        
-        if response.content[:4] != b'%PDF':
-            print(f"  Not a valid PDF")
-            return False
-        
-        output_path.write_bytes(response.content)
-        return True
+        with SESSION.get(pdf_url, timeout=120, stream=True) as response:
+            response.raise_for_status()
+            chunks = response.iter_content(chunk_size=65536)
+            
+            first = next(chunks, b'')
+            if first[:4] != b'%PDF':
+                print(f"  Not a valid PDF")
+                return None
+            
+            digest = hashlib.sha256(first)
+            with open(part, 'wb') as f:
+                f.write(first)
+                for chunk in chunks:
+                    digest.update(chunk)
+                    f.write(chunk)
+            os.replace(part, output_path)
+        return digest.hexdigest()
         
     except requests.RequestException as e:
         print(f"  Error downloading PDF: {e}")
-        return False
+        return None
+    finally:
+        part.unlink(missing_ok=True)  # left over only if the download was cut short
+
+
+def fetch_investigation(inv: dict) -> list[dict]:
+    """Get the documents for one known investigation (worker task)."""
+    try:
+        return get_documents_from_page(inv['url'], inv['name'])
+    finally:
+        polite_pause()
+
+
+def download_document(doc: dict, output_path: Path) -> str | None:
+    """Download one document's PDF (worker task). Returns its SHA-256 (None on failure)."""
+    try:
+        return download_pdf(doc['url'], output_path)
+    finally:
+        polite_pause()
+
+
+def load_json(path: Path) -> dict:
+    """Load a JSON cache file, or an empty dict if it's missing or unreadable."""
+    try:
+        return orjson.loads(path.read_bytes())
+    except (OSError, ValueError):
+        return {}
+
+
+def save_json(path: Path, data):
+    """Write a JSON cache file atomically (a crash never leaves it half-written)."""
+    tmp = path.with_suffix(path.suffix + '.tmp')
+    tmp.write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+    os.replace(tmp, path)
+
+
+def link_existing(existing: Path, output_path: Path):
+    """Save output_path as a hard link to an already-downloaded copy (plain copy if linking fails)."""
+    try:
+        os.link(existing, output_path)
+    except OSError:
+        shutil.copyfile(existing, output_path)
+
+
+class DownloadRecord:
+    """PDFs already saved, by URL and by content hash, kept across runs in DOWNLOADS_FILE."""
+    
+    def __init__(self, path: Path = None):
+        self.path = path or DOWNLOADS_FILE
+        self.by_url = load_json(self.path)  # pdf_url -> {"file": ..., "sha256": ...}
+        self.by_sha = {entry['sha256']: entry['file'] for entry in self.by_url.values()}
+    
+    def existing_copy(self, pdf_url: str) -> Path | None:
+        """A file already holding this URL's PDF, if it is still on disk."""
+        entry = self.by_url.get(pdf_url)
+        if entry and (OUTPUT_DIR / entry['file']).exists():
+            return OUTPUT_DIR / entry['file']
+        return None
+    
+    def add(self, pdf_url: str, output_path: Path, sha256: str) -> bool:
+        """Record a finished download, swapping it for a link if the same bytes are already saved.
+        
+        Returns True if the file was deduplicated.
+        """
+        existing = self.by_sha.get(sha256)
+        deduped = (existing is not None and existing != output_path.name
+                   and (OUTPUT_DIR / existing).exists())
+        if deduped:
+            output_path.unlink()
+            link_existing(OUTPUT_DIR / existing, output_path)
+        else:
+            self.by_sha[sha256] = output_path.name
+        self.by_url[pdf_url] = {'file': output_path.name, 'sha256': sha256}
+        return deduped
+    
+    def save(self):
+        save_json(self.path, self.by_url)
+
+
+# sanitize_filename patterns
+_UNSAFE_CHARS = re.compile(r'[<>:"/\\|?*]')
+_WHITESPACE = re.compile(r'\s+')
+_UNDERSCORES = re.compile(r'_+')
+
+# URL filenames too generic to use as-is (matched case-insensitively)
+_GENERIC_NAME = re.compile(r'status_change|recommendation', re.IGNORECASE)
 
 
 def sanitize_filename(name: str, max_length: int = 80) -> str:
     """Create a safe filename."""
-    safe = re.sub(r'[<>:"/\\|?*]', '_', name)
-    safe = re.sub(r'\s+', '_', safe)
-    safe = re.sub(r'_+', '_', safe)
+    safe = _UNSAFE_CHARS.sub('_', name)
+    safe = _WHITESPACE.sub('_', safe)
+    safe = _UNDERSCORES.sub('_', safe)
     safe = safe.strip('_.')
     
     if len(safe) > max_length:
@@ -138,8 +264,7 @@ def make_unique_filename(investigation: str, title: str, url: str) -> str:
         original = original[:-4]
     
     # If it's a generic name, use the title instead
-    generic_names = ['recommendation_status_change_summary', 'status_change', 'recommendation']
-    if any(g in original.lower() for g in generic_names):
+    if _GENERIC_NAME.search(original):
         # Use title but keep it short
         title_part = sanitize_filename(title)[:40]
         # Add hash of URL to ensure uniqueness
@@ -164,20 +289,37 @@ def main():
     
     all_documents = []
     
+    # Investigations whose documents were found less than a day ago are
+    # reused from the manifest; the rest (including failed pages) are fetched
+    manifest = load_json(MANIFEST_FILE)
+    now = time.time()
+    to_fetch = [inv for inv in KNOWN_INVESTIGATIONS
+                if now - manifest.get(inv['name'], {}).get('fetched_at', 0) >= MANIFEST_MAX_AGE]
+    
+    # Fetch the investigation pages concurrently; map keeps them in list order
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        fetched = dict(zip((inv['name'] for inv in to_fetch),
+                           executor.map(fetch_investigation, to_fetch)))
+    
     for inv in KNOWN_INVESTIGATIONS:
         name = inv['name']
-        url = inv['url']
-        print(f"\n[{name}] Fetching documents...")
+        print(f"\n[{name}]")
         
-        docs = get_documents_from_page(url, name)
+        if name in fetched:
+            docs = fetched[name]
+            if docs:
+                manifest[name] = {'fetched_at': now, 'documents': docs}
+        else:
+            docs = manifest[name]['documents']
+            print("  (from manifest)")
         
         if docs:
             print(f"  Found {len(docs)} documents")
             all_documents.extend(docs)
         else:
             print(f"  No documents found (page may not exist)")
-        
-        time.sleep(1)
+    
+    save_json(MANIFEST_FILE, manifest)
     
     print(f"\nTotal documents found: {len(all_documents)}")
     
@@ -187,35 +329,73 @@ def main():
     skipped = 0
     failed = 0
     
+    # PDFs saved by earlier runs, so a URL linked from several investigations
+    # is downloaded once and linked under the other names
+    record = DownloadRecord()
+    duplicate_urls = []
+    
     with open(log_file, 'w') as log:
         log.write("CSB Reports Download Log (Fixed)\n")
         log.write("=" * 60 + "\n\n")
         
-        for i, doc in enumerate(all_documents):
-            # Create unique filename
-            filename = make_unique_filename(doc['investigation'], doc['title'], doc['url'])
-            output_path = OUTPUT_DIR / filename
+        # Downloads run on a small worker pool; results (and log writes)
+        # are handled here as they finish
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            futures = {}
+            queued = set()
+            queued_urls = set()
+            for doc in all_documents:
+                # Create unique filename
+                filename = make_unique_filename(doc['investigation'], doc['title'], doc['url'])
+                output_path = OUTPUT_DIR / filename
+                
+                # (a PDF linked twice is only downloaded once)
+                if output_path.exists() or output_path in queued:
+                    print(f"Already exists: {filename[:50]}...")
+                    skipped += 1
+                    continue
+                
+                queued.add(output_path)
+                if record.existing_copy(doc['url']) or doc['url'] in queued_urls:
+                    duplicate_urls.append((doc, filename))  # linked once the pool is done
+                    continue
+                
+                queued_urls.add(doc['url'])
+                futures[executor.submit(download_document, doc, output_path)] = (doc, filename)
             
-            if output_path.exists():
-                print(f"[{i+1}/{len(all_documents)}] Already exists: {filename[:50]}...")
-                skipped += 1
-                continue
-            
-            print(f"[{i+1}/{len(all_documents)}] {doc['investigation']}: {doc['title'][:30]}...")
-            
-            if download_pdf(doc['url'], output_path):
-                print(f"  -> Saved: {filename[:50]}")
-                log.write(f"OK: {filename}\n")
-                log.write(f"  Investigation: {doc['investigation']}\n")
-                log.write(f"  Type: {doc['type']}\n")
-                log.write(f"  URL: {doc['url']}\n\n")
-                downloaded += 1
-            else:
-                log.write(f"FAILED: {doc['title']}\n")
-                log.write(f"  URL: {doc['url']}\n\n")
-                failed += 1
-            
-            time.sleep(0.5)
+            for i, future in enumerate(as_completed(futures)):
+                doc, filename = futures[future]
+                print(f"[{i+1}/{len(futures)}] {doc['investigation']}: {doc['title'][:30]}...")
+                sha256 = future.result()
+                
+                if sha256:
+                    if record.add(doc['url'], OUTPUT_DIR / filename, sha256):
+                        print("  (identical to an existing file; hard-linked)")
+                    print(f"  -> Saved: {filename[:50]}")
+                    log.write(f"OK: {filename}\n")
+                    log.write(f"  Investigation: {doc['investigation']}\n")
+                    log.write(f"  Type: {doc['type']}\n")
+                    log.write(f"  URL: {doc['url']}\n\n")
+                    downloaded += 1
+                else:
+                    log.write(f"FAILED: {doc['title']}\n")
+                    log.write(f"  URL: {doc['url']}\n\n")
+                    failed += 1
+        
+        # Same PDF under another investigation's name: link the saved copy
+        for doc, filename in duplicate_urls:
+            existing = record.existing_copy(doc['url'])
+            if not existing:
+                continue  # its download failed, already logged
+            link_existing(existing, OUTPUT_DIR / filename)
+            print(f"Linked to existing copy: {filename[:50]}")
+            log.write(f"OK: {filename} (linked to {existing.name})\n")
+            log.write(f"  Investigation: {doc['investigation']}\n")
+            log.write(f"  Type: {doc['type']}\n")
+            log.write(f"  URL: {doc['url']}\n\n")
+            downloaded += 1
+    
+    record.save()
     
     # Summary
     print("\n" + "=" * 60)
@@ -5,18 +5,42 @@ Correct URLs as of Dec 2025: /oil-and-gas-extraction (not /oil-and-gas)
 """
 
 import requests
-from bs4 import BeautifulSoup
-from pathlib import Path
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from bs4 import BeautifulSoup, SoupStrainer
+from pathlib import Path, PurePosixPath
 import time
+import importlib.util
+import os
+import orjson
+import random
 import re
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 BASE_URL = "https://www.osha.gov"
 OUTPUT_DIR = Path("data/raw/osha_og")
+PAGE_CACHE_FILE = OUTPUT_DIR / "page_cache.json"  # Page URL -> PDF links found + HTTP validators
+PAGE_CACHE_MAX_AGE = 24 * 3600  # Reuse scans younger than this (seconds); older ones are revalidated
+DOWNLOADS_FILE = OUTPUT_DIR / "downloads.json"  # PDF URL -> {"file", "size", "etag", "last_modified"}
+
+# C parser for BeautifulSoup when installed (pip install lxml)
+HTML_PARSER = 'lxml' if importlib.util.find_spec('lxml') else 'html.parser'
 
 HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
 }
+MAX_WORKERS = 5  # Concurrent requests to osha.gov
+
+# One keep-alive session for every request to osha.gov,
+# retrying transient errors with backoff
+SESSION = requests.Session()
+SESSION.headers.update(HEADERS)
+_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16,
+                       max_retries=Retry(total=3, backoff_factor=0.5,
+                                         status_forcelist=[429, 500, 502, 503, 504]))
+SESSION.mount("https://", _adapter)
+SESSION.mount("http://", _adapter)
 
 # CORRECT URLs as of Dec 2025
 KNOWN_PAGES = [
@@ -42,16 +66,49 @@ KNOWN_PAGES = [
 ]
 
 
-def get_pdfs_from_page(url: str) -> list[dict]:
-    """Get all PDF links from a page."""
+def polite_pause():
+    """Per-worker rate limiting, jittered so the workers don't fire in lockstep."""
+    time.sleep(random.uniform(0.4, 0.6))
+
+
+def get_pdfs_from_page(url: str, cached: dict | None = None) -> dict | None:
+    """Get all PDF links from a page, as a page cache entry (None on error).
+    
+    A cached entry is revalidated with a conditional GET; if the page is
+    unchanged (304) its links are reused without downloading or parsing.
+    """
+    headers = {}
+    if cached:
+        if cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+    
     try:
-        response = requests.get(url, headers=HEADERS, timeout=30)
+        response = SESSION.get(url, headers=headers, timeout=30)
         response.raise_for_status()
     except requests.RequestException as e:
         print(f"  Error fetching {url}: {e}")
-        return []
+        return cached  # stale links beat none
     
-    soup = BeautifulSoup(response.content, 'html.parser')
+    if response.status_code == 304:
+        return {**cached, 'fetched_at': time.time()}
+    
+    return {
+        'fetched_at': time.time(),
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'pdfs': extract_pdf_links(response.content, url),
+    }
+
+
+# Only build the <a href> tags when looking for PDF links
+_LINKS = SoupStrainer('a', href=True)
+
+
+def extract_pdf_links(content: bytes, url: str) -> list[dict]:
+    """Get all PDF links from a page's HTML."""
+    soup = BeautifulSoup(content, HTML_PARSER, parse_only=_LINKS)
     pdfs = []
     
     for link in soup.find_all('a', href=True):
@@ -69,28 +126,110 @@ def get_pdfs_from_page(url: str) -> list[dict]:
     return pdfs
 
 
-def download_pdf(pdf_url: str, output_path: Path) -> bool:
-    """Download PDF file."""
+def has_pdf_trailer(path: Path) -> bool:
+    """Whether a PDF file ends properly: %%EOF within its last 1 KiB."""
+    with open(path, 'rb') as f:
+        f.seek(max(path.stat().st_size - 1024, 0))
+        return b'%%EOF' in f.read()
+
+
+def download_pdf(pdf_url: str, output_path: Path, cached: dict | None = None) -> dict | None:
+    """Download PDF file, streaming it straight to disk. Returns its download record (None on failure).
+    
+    With a cached record the GET is conditional; if the server reports the PDF
+    unchanged (304), that same record is returned and nothing is downloaded.
+    """
+    headers = {}
+    if cached:
+        if cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+    
+    # Written beside the old copy, which is only replaced once the new one is complete
+    part = output_path.with_name(output_path.name + '.part')
     try:
-        response = requests.get(pdf_url, headers=HEADERS, timeout=60)
-        response.raise_for_status()
-        
-        if response.content[:4] != b'%PDF':
-            return False
-        
-        output_path.write_bytes(response.content)
-        return True
+        with SESSION.get(pdf_url, headers=headers, timeout=60, stream=True) as response:
+            response.raise_for_status()
+            if response.status_code == 304:
+                return cached
+            chunks = response.iter_content(chunk_size=65536)
+            
+            first = next(chunks, b'')
+            if first[:4] != b'%PDF':
+                return None
+            
+            size = len(first)
+            with open(part, 'wb') as f:
+                f.write(first)
+                for chunk in chunks:
+                    size += len(chunk)
+                    f.write(chunk)
+            
+            # A connection closed early can still end "successfully"; keep only
+            # complete files, so the next run fetches it again
+            expected = response.headers.get('Content-Length', '')
+            if ((expected.isdigit() and not response.headers.get('Content-Encoding')
+                 and int(expected) != size) or not has_pdf_trailer(part)):
+                print(f"  Incomplete PDF ({size} bytes), discarded")
+                part.unlink()
+                return None
+            os.replace(part, output_path)
+            return {
+                'file': output_path.name,
+                'size': size,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+            }
         
     except requests.RequestException as e:
         print(f"  Error downloading: {e}")
-        return False
+        part.unlink(missing_ok=True)  # don't leave a partial file behind
+        return None
+
+
+def scan_page(url: str, cached: dict | None) -> dict | None:
+    """Get the PDF links from one known page (worker task)."""
+    try:
+        return get_pdfs_from_page(url, cached)
+    finally:
+        polite_pause()
+
+
+def load_json(path: Path) -> dict:
+    """Load a JSON cache file, or an empty dict if it's missing or unreadable."""
+    try:
+        return orjson.loads(path.read_bytes())
+    except (OSError, ValueError):
+        return {}
+
+
+def save_json(path: Path, data):
+    """Write a JSON cache file atomically (a crash never leaves it half-written)."""
+    tmp = path.with_suffix(path.suffix + '.tmp')
+    tmp.write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+    os.replace(tmp, path)
+
+
+def download_document(url: str, output_path: Path, cached: dict | None) -> dict | None:
+    """Download one PDF, if changed since its cached record (worker task)."""
+    try:
+        return download_pdf(url, output_path, cached)
+    finally:
+        polite_pause()
+
+
+# sanitize_filename patterns
+_UNSAFE_CHARS = re.compile(r'[<>:"/\\|?*]')
+_WHITESPACE = re.compile(r'\s+')
+_UNDERSCORES = re.compile(r'_+')
 
 
 def sanitize_filename(name: str, max_length: int = 100) -> str:
     """Create a safe filename."""
-    safe = re.sub(r'[<>:"/\\|?*]', '_', name)
-    safe = re.sub(r'\s+', '_', safe)
-    safe = re.sub(r'_+', '_', safe)
+    safe = _UNSAFE_CHARS.sub('_', name)
+    safe = _WHITESPACE.sub('_', safe)
+    safe = _UNDERSCORES.sub('_', safe)
     safe = safe.strip('_.')
     
     if len(safe) > max_length:
@@ -112,16 +251,34 @@ def main():
     
     print("\nStep 1: Scanning OSHA pages for PDFs...")
     
+    # Pages scanned less than a day ago are taken from the page cache; the
+    # rest are fetched concurrently (conditionally, if cached before)
+    page_cache = load_json(PAGE_CACHE_FILE)
+    now = time.time()
+    to_fetch = [url for url in KNOWN_PAGES
+                if now - page_cache.get(url, {}).get('fetched_at', 0) >= PAGE_CACHE_MAX_AGE]
+    
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        fetched = dict(zip(to_fetch, executor.map(scan_page, to_fetch,
+                                                  [page_cache.get(url) for url in to_fetch])))
+    
+    # Walk the pages in list order, so the first page to link a PDF still names it
     for page_url in KNOWN_PAGES:
         print(f"\nScanning: {page_url}")
         
-        pdfs = get_pdfs_from_page(page_url)
-        for pdf in pdfs:
+        if page_url not in fetched:
+            print("  (from page cache)")
+        elif fetched[page_url]:
+            page_cache[page_url] = fetched[page_url]
+        else:
+            page_cache.pop(page_url, None)
+        
+        for pdf in page_cache.get(page_url, {}).get('pdfs', []):
             if pdf['url'] not in all_pdfs:
                 all_pdfs[pdf['url']] = pdf
                 print(f"  Found: {pdf['title'][:50]}...")
-        
-        time.sleep(0.5)
+    
+    save_json(PAGE_CACHE_FILE, page_cache)
     
     print(f"\nTotal unique PDFs found: {len(all_pdfs)}")
     
@@ -139,39 +296,74 @@ def main():
     skipped = 0
     failed = 0
     
+    # Records of earlier downloads let unchanged PDFs be skipped after a
+    # conditional GET, and catch files left truncated by an interrupted run
+    downloads = load_json(DOWNLOADS_FILE)
+    
     with open(log_file, 'w') as log:
         log.write("OSHA O&G Download Log (Fixed)\n")
         log.write("=" * 60 + "\n\n")
         
-        for i, (url, info) in enumerate(all_pdfs.items()):
-            filename = url.split('/')[-1]
-            if not filename.endswith('.pdf'):
-                filename = sanitize_filename(info['title']) + '.pdf'
-            
-            # Prefix with OSHA for clarity
-            if not filename.upper().startswith('OSHA'):
-                filename = f"OSHA_{filename}"
+        # Downloads run on a small worker pool; results (and log writes)
+        # are handled here as they finish
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            futures = {}
+            queued = set()
+            for url, info in all_pdfs.items():
+                # (the URL path's last segment, without any query string)
+                filename = PurePosixPath(urlparse(url).path).name
+                if not filename.endswith('.pdf'):
+                    filename = sanitize_filename(info['title']) + '.pdf'
+                
+                # Prefix with OSHA for clarity
+                if filename[:4].upper() != 'OSHA':
+                    filename = f"OSHA_{filename}"
+                
+                output_path = OUTPUT_DIR / filename
+                
+                # (two URLs ending in the same filename are only downloaded once)
+                if output_path in queued:
+                    print(f"Already exists: {filename[:50]}...")
+                    skipped += 1
+                    continue
+                
+                # A file without a matching record is incomplete or of unknown
+                # origin, and is downloaded again
+                cached = downloads.get(url)
+                if cached and not (cached['file'] == filename and output_path.exists()
+                                   and output_path.stat().st_size == cached['size']):
+                    cached = None
+                if cached and not (cached['etag'] or cached['last_modified']):
+                    print(f"Already exists: {filename[:50]}...")  # (nothing to revalidate with)
+                    skipped += 1
+                    continue
+                
+                queued.add(output_path)
+                futures[executor.submit(download_document, url, output_path, cached)] = (url, filename, cached)
             
-            output_path = OUTPUT_DIR / filename
-            
-            if output_path.exists():
-                print(f"[{i+1}/{len(all_pdfs)}] Already exists: {filename[:50]}...")
-                skipped += 1
-                continue
-            
-            print(f"[{i+1}/{len(all_pdfs)}] Downloading: {filename[:50]}...")
-            
-            if download_pdf(url, output_path):
-                print(f"  -> Saved")
-                log.write(f"OK: {filename}\n")
-                log.write(f"  URL: {url}\n\n")
-                downloaded += 1
-            else:
-                log.write(f"FAILED: {filename}\n")
-                log.write(f"  URL: {url}\n\n")
-                failed += 1
-            
-            time.sleep(0.5)
+            for i, future in enumerate(as_completed(futures)):
+                url, filename, cached = futures[future]
+                entry = future.result()
+                
+                if entry is not None and entry is cached:
+                    print(f"Unchanged: {filename[:50]}...")
+                    skipped += 1
+                    continue
+                
+                print(f"[{i+1}/{len(futures)}] Downloading: {filename[:50]}...")
+                
+                if entry:
+                    downloads[url] = entry
+                    print(f"  -> Saved")
+                    log.write(f"OK: {filename}\n")
+                    log.write(f"  URL: {url}\n\n")
+                    downloaded += 1
+                else:
+                    log.write(f"FAILED: {filename}\n")
+                    log.write(f"  URL: {url}\n\n")
+                    failed += 1
+    
+    save_json(DOWNLOADS_FILE, downloads)
     
     # Summary
     print("\n" + "=" * 60)
@@ -6,16 +6,34 @@ Uses Federal Register API and known direct PDF links
 """
 
 import requests
-from pathlib import Path
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from pathlib import Path, PurePosixPath
 import time
+import random
 import re
-import json
+import os
+import orjson
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 OUTPUT_DIR = Path("data/raw/phmsa_advisories")
+DOWNLOADS_FILE = OUTPUT_DIR / "downloads.json"  # PDF URL -> {"file", "size", "etag", "last_modified"}
 
 HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
 }
+MAX_WORKERS = 5  # Concurrent PDF downloads
+
+# One keep-alive session (federalregister.gov, govinfo.gov, phmsa.dot.gov),
+# retrying transient errors with backoff
+SESSION = requests.Session()
+SESSION.headers.update(HEADERS)
+_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16,
+                       max_retries=Retry(total=3, backoff_factor=0.5,
+                                         status_forcelist=[429, 500, 502, 503, 504]))
+SESSION.mount("https://", _adapter)
+SESSION.mount("http://", _adapter)
 
 # Federal Register API - search for PHMSA pipeline advisory bulletins
 FR_API_BASE = "https://www.federalregister.gov/api/v1"
@@ -46,6 +64,11 @@ KNOWN_PDFS = [
 ]
 
 
+def polite_pause():
+    """Per-worker rate limiting, jittered so the workers don't fire in lockstep."""
+    time.sleep(random.uniform(0.4, 0.6))
+
+
 def search_federal_register():
     """Search Federal Register for PHMSA advisory bulletins."""
     documents = []
@@ -63,7 +86,7 @@ def search_federal_register():
     print("Searching Federal Register for PHMSA advisory bulletins...")
     
     try:
-        response = requests.get(search_url, params=params, headers=HEADERS, timeout=30)
+        response = SESSION.get(search_url, params=params, timeout=30)
         response.raise_for_status()
         data = response.json()
         
@@ -88,31 +111,104 @@ def search_federal_register():
     return documents
 
 
-def download_pdf(url: str, output_path: Path) -> bool:
-    """Download PDF file."""
+def has_pdf_trailer(path: Path) -> bool:
+    """Whether a PDF file ends properly: %%EOF within its last 1 KiB."""
+    with open(path, 'rb') as f:
+        f.seek(max(path.stat().st_size - 1024, 0))
+        return b'%%EOF' in f.read()
+
+
+def download_pdf(url: str, output_path: Path, cached: dict | None = None) -> dict | None:
+    """Download PDF file, streaming it straight to disk. Returns its download record (None on failure).
+    
+    With a cached record the GET is conditional; if the server reports the PDF
+    unchanged (304), that same record is returned and nothing is downloaded.
+    """
+    headers = {}
+    if cached:
+        if cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+    
+    # Written beside the old copy, which is only replaced once the new one is complete
+    part = output_path.with_name(output_path.name + '.part')
     try:
-        response = requests.get(url, headers=HEADERS, timeout=60)
-        response.raise_for_status()
-        
-        # Check if it's a PDF
-        content_type = response.headers.get('content-type', '')
-        if 'pdf' not in content_type.lower() and response.content[:4] != b'%PDF':
-            print(f"  Not a PDF: {content_type}")
-            return False
-        
-        output_path.write_bytes(response.content)
-        return True
+        with SESSION.get(url, headers=headers, timeout=60, stream=True) as response:
+            response.raise_for_status()
+            if response.status_code == 304:
+                return cached
+            chunks = response.iter_content(chunk_size=65536)
+            
+            # Check if it's a PDF (by its magic bytes; Content-Type is often wrong)
+            first = next(chunks, b'')
+            if first[:4] != b'%PDF':
+                print(f"  Not a PDF: {response.headers.get('content-type', '')}")
+                return None
+            
+            size = len(first)
+            with open(part, 'wb') as f:
+                f.write(first)
+                for chunk in chunks:
+                    size += len(chunk)
+                    f.write(chunk)
+            
+            # A connection closed early can still end "successfully"; keep only
+            # complete files, so the next run fetches it again
+            expected = response.headers.get('Content-Length', '')
+            if ((expected.isdigit() and not response.headers.get('Content-Encoding')
+                 and int(expected) != size) or not has_pdf_trailer(part)):
+                print(f"  Incomplete PDF ({size} bytes), discarded")
+                part.unlink()
+                return None
+            os.replace(part, output_path)
+            return {
+                'file': output_path.name,
+                'size': size,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+            }
         
     except requests.RequestException as e:
         print(f"  Error downloading: {e}")
-        return False
+        part.unlink(missing_ok=True)  # don't leave a partial file behind
+        return None
+
+
+def load_json(path: Path) -> dict:
+    """Load a JSON cache file, or an empty dict if it's missing or unreadable."""
+    try:
+        return orjson.loads(path.read_bytes())
+    except (OSError, ValueError):
+        return {}
+
+
+def save_json(path: Path, data):
+    """Write a JSON cache file atomically (a crash never leaves it half-written)."""
+    tmp = path.with_suffix(path.suffix + '.tmp')
+    tmp.write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+    os.replace(tmp, path)
+
+
+def download_document(url: str, output_path: Path, cached: dict | None) -> dict | None:
+    """Download one PDF, if changed since its cached record (worker task)."""
+    try:
+        return download_pdf(url, output_path, cached)
+    finally:
+        polite_pause()
+
+
+# sanitize_filename patterns
+_UNSAFE_CHARS = re.compile(r'[<>:"/\\|?*]')
+_WHITESPACE = re.compile(r'\s+')
+_UNDERSCORES = re.compile(r'_+')
 
 
 def sanitize_filename(name: str, max_length: int = 100) -> str:
     """Create a safe filename."""
-    safe = re.sub(r'[<>:"/\\|?*]', '_', name)
-    safe = re.sub(r'\s+', '_', safe)
-    safe = re.sub(r'_+', '_', safe)
+    safe = _UNSAFE_CHARS.sub('_', name)
+    safe = _WHITESPACE.sub('_', safe)
+    safe = _UNDERSCORES.sub('_', safe)
     safe = safe.strip('_.')
     
     if len(safe) > max_length:
@@ -131,27 +227,19 @@ def main():
     print("=" * 60)
     
     # Collect documents
-    all_docs = []
+    all_docs = {}  # URL -> info dict to dedupe
     
     # 1. Search Federal Register
-    fr_docs = search_federal_register()
-    all_docs.extend(fr_docs)
+    for doc in search_federal_register():
+        all_docs.setdefault(doc['url'], doc)
     
     # 2. Add known direct PDFs
     print(f"\nAdding {len(KNOWN_PDFS)} known direct PDF links...")
     for pdf in KNOWN_PDFS:
         pdf['source'] = 'known_direct'
-        all_docs.append(pdf)
-    
-    # Dedupe by URL
-    seen = set()
-    unique_docs = []
-    for doc in all_docs:
-        if doc['url'] not in seen:
-            seen.add(doc['url'])
-            unique_docs.append(doc)
+        all_docs.setdefault(pdf['url'], pdf)
     
-    print(f"\nTotal unique documents: {len(unique_docs)}")
+    print(f"\nTotal unique documents: {len(all_docs)}")
     
     # Download PDFs
     print("\nDownloading PDFs...")
@@ -159,41 +247,77 @@ def main():
     skipped = 0
     failed = 0
     
+    # Records of earlier downloads let unchanged PDFs be skipped after a
+    # conditional GET, and catch files left truncated by an interrupted run
+    downloads = load_json(DOWNLOADS_FILE)
+    
     with open(log_file, 'w') as log:
         log.write("PHMSA Documents Download Log (Alternative Method)\n")
         log.write("=" * 60 + "\n\n")
         
-        for i, doc in enumerate(unique_docs):
-            # Create filename
-            title = doc.get('title', doc['url'].split('/')[-1])
-            filename = f"PHMSA_{sanitize_filename(title)}.pdf"
-            output_path = OUTPUT_DIR / filename
-            
-            if output_path.exists():
-                print(f"[{i+1}/{len(unique_docs)}] Already exists: {filename[:50]}...")
-                skipped += 1
-                continue
+        # Downloads run on a small worker pool; results (and log writes)
+        # are handled here as they finish
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            futures = {}
+            queued = set()
+            # Grouped by host, so each host's pooled connections are reused
+            # back to back (sorted() is stable: list order holds within a host)
+            for url, doc in sorted(all_docs.items(), key=lambda item: urlparse(item[0]).netloc):
+                # Create filename
+                title = doc.get('title') or PurePosixPath(urlparse(url).path).name
+                filename = f"PHMSA_{sanitize_filename(title)}.pdf"
+                output_path = OUTPUT_DIR / filename
+                
+                # (two documents with the same title are only downloaded once)
+                if output_path in queued:
+                    print(f"Already exists: {filename[:50]}...")
+                    skipped += 1
+                    continue
+                
+                # A file without a matching record is incomplete or of unknown
+                # origin, and is downloaded again
+                cached = downloads.get(url)
+                if cached and not (cached['file'] == filename and output_path.exists()
+                                   and output_path.stat().st_size == cached['size']):
+                    cached = None
+                if cached and not (cached['etag'] or cached['last_modified']):
+                    print(f"Already exists: {filename[:50]}...")  # (nothing to revalidate with)
+                    skipped += 1
+                    continue
+                
+                queued.add(output_path)
+                futures[executor.submit(download_document, url, output_path, cached)] = (doc, title, filename, cached)
             
-            print(f"[{i+1}/{len(unique_docs)}] Downloading: {title[:50]}...")
-            
-            if download_pdf(doc['url'], output_path):
-                print(f"  -> Saved: {filename[:50]}")
-                log.write(f"OK: {filename}\n")
-                log.write(f"  URL: {doc['url']}\n")
-                log.write(f"  Source: {doc.get('source', 'unknown')}\n\n")
-                downloaded += 1
-            else:
-                log.write(f"FAILED: {title}\n")
-                log.write(f"  URL: {doc['url']}\n\n")
-                failed += 1
-            
-            time.sleep(0.5)
+            for i, future in enumerate(as_completed(futures)):
+                doc, title, filename, cached = futures[future]
+                entry = future.result()
+                
+                if entry is not None and entry is cached:
+                    print(f"Unchanged: {filename[:50]}...")
+                    skipped += 1
+                    continue
+                
+                print(f"[{i+1}/{len(futures)}] Downloading: {title[:50]}...")
+                
+                if entry:
+                    downloads[doc['url']] = entry
+                    print(f"  -> Saved: {filename[:50]}")
+                    log.write(f"OK: {filename}\n")
+                    log.write(f"  URL: {doc['url']}\n")
+                    log.write(f"  Source: {doc.get('source', 'unknown')}\n\n")
+                    downloaded += 1
+                else:
+                    log.write(f"FAILED: {title}\n")
+                    log.write(f"  URL: {doc['url']}\n\n")
+                    failed += 1
+    
+    save_json(DOWNLOADS_FILE, downloads)
     
     # Summary
     print("\n" + "=" * 60)
     print("DOWNLOAD SUMMARY")
     print("=" * 60)
-    print(f"Documents found:    {len(unique_docs)}")
+    print(f"Documents found:    {len(all_docs)}")
     print(f"Downloaded:         {downloaded}")
     print(f"Already existed:    {skipped}")
     print(f"Failed:             {failed}")